@@ -3,32 +3,116 @@ Initializes the Flask application and configures the SQLAlchemy database connect
 """
 
 import os
+import time
+from importlib import import_module
 from flask import Flask
 from extensions import db
-from routes.routing import routing_bp
-from layers.site_location import sites_bp
-from layers.heat_map import heatmap_bp
 from dotenv import load_dotenv
-   
+
 """
 This file sets up the Flask application and SQLAlchemy database connection.
+Blueprints are imported only when enabled, so a deployment that serves only the
+heatmap never loads the routing dependencies (openrouteservice, route enrichment).
 Author: Ross Cochrane
 """
 
-load_dotenv()
-# Create the Flask application
-app = Flask(__name__)
+# Blueprint name -> (enable flag, module, blueprint attribute)
+BLUEPRINTS = {
+    'routing': ('ENABLE_ROUTING', 'routes.routing', 'routing_bp'),
+    'sites': ('ENABLE_SITES', 'layers.site_location', 'sites_bp'),
+    'heatmap': ('ENABLE_HEATMAP', 'layers.heat_map', 'heatmap_bp'),
+    'metrics': ('ENABLE_METRICS', 'routes.metrics', 'metrics_bp'),
+}
 
-# Configure the database 
-import os
 
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+def env_flag(name, default=True):
+    """Read a boolean flag from the environment, e.g. ENABLE_ROUTING=false."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def check_scoring_config(config):
+    """
+    Normalise and validate the route scoring settings, so a bad value fails at startup
+    rather than on every route request.
+    :raises ValueError: If a setting is not valid
+    """
+    from utils.routes.enrichment import SCORING_MODES
+
+    if 'ROUTE_SCORING' in config:
+        config['ROUTE_SCORING'] = str(config['ROUTE_SCORING']).strip().lower()
+        if config['ROUTE_SCORING'] not in SCORING_MODES:
+            raise ValueError(f"ROUTE_SCORING must be one of {', '.join(SCORING_MODES)}")
+    if config.get('KNN_NEIGHBOURS', 1) < 1:
+        raise ValueError('KNN_NEIGHBOURS must be at least 1')
+    if config.get('KNN_MAX_RADIUS_M', 1) <= 0:
+        raise ValueError('KNN_MAX_RADIUS_M must be greater than 0')
+    if config.get('KNN_POWER', 1) <= 0:
+        raise ValueError('KNN_POWER must be greater than 0')
+    if config.get('SITE_INDEX_TTL', 0) < 0:
+        raise ValueError('SITE_INDEX_TTL must not be negative')
+
+
+def create_app(config=None):
+    """
+    Application factory.
+    :param config: Optional dict of config values overriding the environment,
+                   e.g. {'ENABLE_ROUTING': False} for a heatmap-only worker
+    :return: Configured Flask application
+    """
+    started = time.perf_counter()
+    load_dotenv()
+
+    # Create the Flask application
+    app = Flask(__name__)
+
+    # Configure the database
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SNAPSHOT_PATH'] = os.getenv('SNAPSHOT_PATH')
+    app.config['SNAPSHOT_REFRESH_SECONDS'] = float(os.getenv('SNAPSHOT_REFRESH_SECONDS', '30'))
+    for flag, _, _ in BLUEPRINTS.values():
+        app.config[flag] = env_flag(flag)
+
+    # Route scoring, see utils/pollution/site_index.py for the k-nearest-site defaults
+    for name, cast in (('ROUTE_SCORING', str), ('KNN_NEIGHBOURS', int), ('KNN_MAX_RADIUS_M', float),
+                       ('KNN_POWER', float), ('SITE_INDEX_TTL', float)):
+        if os.getenv(name) is not None:
+            app.config[name] = cast(os.getenv(name))
+
+    if config:
+        app.config.update(config)
+
+    if app.config['ENABLE_ROUTING']:
+        check_scoring_config(app.config)
+
+    db.init_app(app)
+
+    # Shared readings snapshot written by the gunicorn refresher (see gunicorn.conf.py)
+    if app.config['SNAPSHOT_PATH']:
+        from utils.pollution.snapshot import SnapshotReader, STALE_AFTER_REFRESHES
+        app.extensions['readings_snapshot'] = SnapshotReader(
+            app.config['SNAPSHOT_PATH'],
+            max_age=app.config['SNAPSHOT_REFRESH_SECONDS'] * STALE_AFTER_REFRESHES
+        )
+
+    # Blueprints
+    for flag, module_name, attribute in BLUEPRINTS.values():
+        if app.config[flag]:
+            app.register_blueprint(getattr(import_module(module_name), attribute))
 
+    app.config['STARTUP_SECONDS'] = time.perf_counter() - started
+    return app
 
-# Blueprints
-app.register_blueprint(routing_bp)
-app.register_blueprint(sites_bp)
-app.register_blueprint(heatmap_bp)
 
+def __getattr__(name):
+    """
+    Build the module level `app` on first access, so `from app import app`
+    keeps working without importing this module creating an application.
+    """
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
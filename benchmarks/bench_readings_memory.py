@@ -0,0 +1,148 @@
+"""
+Benchmarks memory and allocations of the per-vertex reading lookup used by route enrichment.
+Compares the previous ORM query (full PollutionReading instances), latest_reading_row (plain
+column rows) and latest_snapshot_row (site codes from SQL, readings from the snapshot), each
+running its real join, ordering and per-vertex queries. Uses an in-memory SQLite database, so
+within_radius is replaced with a bounding box on the site coordinates of the same size.
+
+Usage: python benchmarks/bench_readings_memory.py [vertices]
+Author: Ross Cochrane
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from sqlalchemy import and_, insert, text
+from app import create_app
+from extensions import db
+from models.site import Site
+from models.pollution_reading import PollutionReading
+from utils.pollution.aqi import compute_aqi
+from utils.pollution.latest import query_latest_readings
+from utils.pollution.snapshot import DB_ONLY_CONFIG, write_snapshot, SnapshotReader
+from utils.routes import enrichment
+
+SITES = 200
+READINGS_PER_SITE = 10
+
+# (min lon, min lat, max lon, max lat), dense enough that most vertices have a site within the radius
+BBOX = (-1.63, 54.96, -1.60, 54.99)
+
+
+def within_box(lon, lat):
+    """Stand-in for within_radius: sites inside a SEARCH_RADIUS bounding box around the point."""
+    r = enrichment.SEARCH_RADIUS
+    return and_(Site.longitude.between(lon - r, lon + r), Site.latitude.between(lat - r, lat + r))
+
+
+def seed():
+    """Create the sites and readings tables and fill them with synthetic data."""
+    # SQLite has no geometry type, the location column is never read by the lookups
+    db.session.execute(text(
+        'CREATE TABLE sites (system_code_number VARCHAR PRIMARY KEY, latitude FLOAT, longitude FLOAT, location BLOB)'
+    ))
+    PollutionReading.__table__.create(db.engine)
+
+    rng = random.Random(1)
+    min_lon, min_lat, max_lon, max_lat = BBOX
+    sites = [
+        {'system_code_number': f'SITE{i}', 'latitude': rng.uniform(min_lat, max_lat),
+         'longitude': rng.uniform(min_lon, max_lon)}
+        for i in range(SITES)
+    ]
+    db.session.execute(text(
+        'INSERT INTO sites (system_code_number, latitude, longitude) VALUES (:system_code_number, :latitude, :longitude)'
+    ), sites)
+
+    now = datetime(2025, 7, 1)
+    db.session.execute(insert(PollutionReading), [
+        {
+            'system_code_number': f'SITE{i % SITES}',
+            'co': rng.uniform(0.1, 5.0),
+            'no': rng.uniform(1, 150),
+            'no2': rng.uniform(5, 300),
+            'noise': rng.uniform(30, 100),
+            'last_updated': now - timedelta(minutes=i)
+        }
+        for i in range(SITES * READINGS_PER_SITE)
+    ])
+    db.session.commit()
+
+
+def route(vertices):
+    """A route zig-zagging across the seeded area, one vertex every ~15m."""
+    min_lon, min_lat, max_lon, max_lat = BBOX
+    step = 0.00015
+    per_row = int((max_lon - min_lon) / step)
+    return [
+        (min_lon + (v % per_row) * step, min_lat + (v // per_row) * 0.002 % (max_lat - min_lat))
+        for v in range(vertices)
+    ]
+
+
+def orm_lookup(lon, lat):
+    """The lookup as it was before latest_reading_row: full ORM instances."""
+    return PollutionReading.query.join(Site).filter(
+        enrichment.within_radius(lon, lat)
+    ).order_by(PollutionReading.last_updated.desc()).first()
+
+
+def measure(name, lookup, coordinates):
+    """Score every vertex of a route through `lookup` and report allocations."""
+    db.session.expunge_all()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    scores = []
+    for lon, lat in coordinates:
+        reading = lookup(lon, lat)
+        scores.append(compute_aqi(reading, 'aqi') if reading else None)
+    elapsed = time.perf_counter() - started
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    retained = sum(stat.size for stat in snapshot.statistics('filename'))
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    print(f'{name:<10} peak {peak / 1024:9.1f} KiB   retained {retained / 1024:9.1f} KiB '
+          f'in {blocks:7d} blocks   {elapsed * 1000:8.1f} ms')
+    return scores
+
+
+def main():
+    vertices = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    app = create_app(dict(DB_ONLY_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite://'))
+    directory = tempfile.mkdtemp()
+
+    try:
+        with app.app_context(), patch.object(enrichment, 'within_radius', within_box):
+            seed()
+
+            path = os.path.join(directory, 'readings.snapshot')
+            write_snapshot(path, query_latest_readings(include_empty_sites=True), 1)
+            readings = SnapshotReader(path).get()
+
+            coordinates = route(vertices)
+            print(f'{vertices} vertex lookups over {SITES} sites with {READINGS_PER_SITE} readings each')
+            orm = measure('orm', orm_lookup, coordinates)
+            rows = measure('rows', enrichment.latest_reading_row, coordinates)
+            snapshot = measure(
+                'snapshot', lambda lon, lat: enrichment.latest_snapshot_row(readings, lon, lat), coordinates
+            )
+            assert orm == rows == snapshot
+            print(f'{sum(s is not None for s in orm)} of {vertices} vertices have a site within the radius')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
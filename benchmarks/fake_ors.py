@@ -0,0 +1,204 @@
+"""
+A local stand-in for the OpenRouteService directions API, for load testing.
+Answers POST /v2/directions/<profile>/geojson with a street-like route through the
+requested coordinates, after a configurable latency. A share of requests can fail on purpose.
+
+Usage: python benchmarks/fake_ors.py --port 8090 --latency 0.15 --jitter 0.05
+Then run the API with ORS_BASE_URL=http://127.0.0.1:8090
+Author: Ross Cochrane
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Spacing between generated vertices in degrees (~15-20m), similar to ORS street geometry
+VERTEX_SPACING = 0.00018
+
+# Travel speeds in m/s used for the summary duration
+SPEEDS = {'foot-walking': 1.4, 'cycling-regular': 4.2}
+
+
+def haversine(a, b):
+    """Distance in metres between two [lon, lat] points."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+def street_leg(start, end, rng):
+    """
+    Vertices from start to end following a block pattern: alternating runs along
+    longitude and latitude with small jitter, like a route through a street grid.
+    The start point is included, the end point is not.
+    """
+    lon, lat = start
+    vertices = [[round(lon, 6), round(lat, 6)]]
+    while True:
+        can_lon = abs(end[0] - lon) >= VERTEX_SPACING
+        can_lat = abs(end[1] - lat) >= VERTEX_SPACING
+        if not (can_lon or can_lat):
+            return vertices
+
+        # Walk a block of 3-8 vertices along one axis, favouring the longer remaining distance
+        if can_lon and can_lat:
+            d_lon, d_lat = abs(end[0] - lon), abs(end[1] - lat)
+            along_lon = rng.random() < d_lon / (d_lon + d_lat)
+        else:
+            along_lon = can_lon
+
+        for _ in range(rng.randint(3, 8)):
+            if along_lon:
+                if abs(end[0] - lon) < VERTEX_SPACING:
+                    break
+                lon += math.copysign(VERTEX_SPACING, end[0] - lon)
+                lat += rng.uniform(-0.00002, 0.00002)
+            else:
+                if abs(end[1] - lat) < VERTEX_SPACING:
+                    break
+                lat += math.copysign(VERTEX_SPACING, end[1] - lat)
+                lon += rng.uniform(-0.00002, 0.00002)
+            vertices.append([round(lon, 6), round(lat, 6)])
+
+
+def directions_geojson(coordinates, profile):
+    """Build an ORS-shaped GeoJSON directions response through the given waypoints."""
+    rng = random.Random(json.dumps(coordinates))
+    speed = SPEEDS.get(profile, 1.4)
+
+    geometry = []
+    segments = []
+    way_points = [0]
+    for start, end in zip(coordinates, coordinates[1:]):
+        leg = street_leg(start, end, rng)
+        distance = sum(haversine(a, b) for a, b in zip(leg, leg[1:] + [end]))
+        segments.append({
+            'distance': round(distance, 1),
+            'duration': round(distance / speed, 1),
+            'steps': [
+                {'distance': round(distance, 1), 'duration': round(distance / speed, 1), 'type': 11,
+                 'instruction': 'Head north', 'name': '-', 'way_points': [len(geometry), len(geometry) + len(leg)]},
+                {'distance': 0.0, 'duration': 0.0, 'type': 10, 'instruction': 'Arrive at your destination',
+                 'name': '-', 'way_points': [len(geometry) + len(leg)] * 2}
+            ]
+        })
+        geometry.extend(leg)
+        way_points.append(len(geometry))
+    geometry.append([round(coordinates[-1][0], 6), round(coordinates[-1][1], 6)])
+
+    lons = [c[0] for c in geometry]
+    lats = [c[1] for c in geometry]
+    bbox = [min(lons), min(lats), max(lons), max(lats)]
+    distance = sum(s['distance'] for s in segments)
+
+    return {
+        'type': 'FeatureCollection',
+        'bbox': bbox,
+        'features': [{
+            'bbox': bbox,
+            'type': 'Feature',
+            'properties': {
+                'segments': segments,
+                'way_points': way_points,
+                'summary': {'distance': round(distance, 1), 'duration': round(distance / speed, 1)}
+            },
+            'geometry': {'coordinates': geometry, 'type': 'LineString'}
+        }],
+        'metadata': {
+            'attribution': 'openrouteservice.org | OpenStreetMap contributors',
+            'service': 'routing',
+            'query': {'coordinates': coordinates, 'profile': profile, 'format': 'geojson'},
+            'engine': {'version': 'fake'}
+        }
+    }
+
+
+class FakeORS:
+    """
+    Runs the stand-in ORS server on a background thread.
+    :param latency: Mean response latency in seconds
+    :param jitter: Latency varies uniformly by up to this many seconds either way
+    :param error_rate: Share of requests answered with HTTP 500
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.15, jitter=0.05, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler(self):
+        ors = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                parts = self.path.split('?')[0].strip('/').split('/')
+                if len(parts) != 4 or parts[:2] != ['v2', 'directions'] or parts[3] != 'geojson':
+                    return self.reply(404, {'error': {'code': 2099, 'message': 'Not found'}})
+
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with ors._lock:
+                    ors.requests += 1
+
+                time.sleep(max(0.0, ors.latency + random.uniform(-ors.jitter, ors.jitter)))
+                if random.random() < ors.error_rate:
+                    return self.reply(500, {'error': {'code': 2099, 'message': 'Simulated failure'}})
+                self.reply(200, directions_geojson(body['coordinates'], parts[2]))
+
+            def reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/geo+json;charset=UTF-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # Keep load test output readable
+
+        return Handler
+
+    def start(self):
+        """Start serving in the background and return self."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-ors', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.15, help='mean latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with 500')
+    args = parser.parse_args()
+
+    ors = FakeORS(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f'Fake ORS listening on {ors.url}')
+    try:
+        ors._server.serve_forever()
+    except KeyboardInterrupt:
+        ors.stop()
+
+
+if __name__ == '__main__':
+    main()
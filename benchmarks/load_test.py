@@ -0,0 +1,255 @@
+"""
+Load test harness for the API.
+Starts a local fake ORS server and seeds a PostGIS or SpatiaLite database with synthetic sites
+and readings. It then serves the app in-process, or targets an already running server, and
+drives open-loop traffic against /routing/route, /sites and /heatmap/latest_readings.
+Requests are sent on a Poisson schedule whether or not earlier ones have finished. Latency is
+measured from each request's scheduled time, so queueing under overload is included.
+Reports p50/p95/p99 latency, throughput and error rate per endpoint.
+
+Usage:
+    python benchmarks/load_test.py --rate 20 --duration 30
+    LOADTEST_DATABASE_URL=postgresql://... python benchmarks/load_test.py --rate 50 --snapshot
+    python benchmarks/load_test.py --target http://127.0.0.1:8000 --ors-port 8090
+Author: Ross Cochrane
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import requests
+from fake_ors import FakeORS
+from seed_db import DEFAULT_BBOX, check_database, loadtest_config, prepare_engine, seed
+
+ENDPOINTS = ('routing', 'sites', 'heatmap')
+POLLUTANTS = ('co', 'no2', 'noise', 'aqi')
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list, None if empty."""
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarise(results, elapsed):
+    """
+    Per-endpoint statistics from (endpoint, latency seconds, ok) results.
+    :param elapsed: Wall clock seconds the test ran for, used for throughput
+    """
+    summary = {}
+    for endpoint in ENDPOINTS:
+        latencies = sorted(latency for name, latency, _ in results if name == endpoint)
+        errors = sum(1 for name, _, ok in results if name == endpoint and not ok)
+        if not latencies:
+            continue
+        summary[endpoint] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': round(errors / len(latencies), 4),
+            'throughput_rps': round((len(latencies) - errors) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1)
+        }
+    return summary
+
+
+def print_report(summary, elapsed):
+    """Print the summary as a table."""
+    print(f'\nCompleted in {elapsed:.1f}s')
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'err %':>8}{'ok rps':>9}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, s in summary.items():
+        print(f"{endpoint:<10}{s['requests']:>10}{s['errors']:>8}{s['error_rate'] * 100:>8.2f}"
+              f"{s['throughput_rps']:>9.2f}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+
+
+def parse_mix(value):
+    """Parse an endpoint mix like 'routing=1,sites=1,heatmap=2' into weights."""
+    weights = dict.fromkeys(ENDPOINTS, 0.0)
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in weights:
+            raise argparse.ArgumentTypeError(f'Unknown endpoint {name!r}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def route_pool(count, bbox, rng):
+    """Distinct route requests within the seeded area; popular routes repeat, as at commute peaks."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    pool = []
+    for _ in range(count):
+        pool.append({
+            'start': [round(rng.uniform(min_lon, max_lon), 6), round(rng.uniform(min_lat, max_lat), 6)],
+            'end': [round(rng.uniform(min_lon, max_lon), 6), round(rng.uniform(min_lat, max_lat), 6)],
+            'mode': rng.choice(['foot-walking', 'cycling-regular']),
+            'pollutant': rng.choice(POLLUTANTS)
+        })
+    return pool
+
+
+class LoadGenerator:
+    """Sends requests on an open-loop Poisson schedule and records their outcome."""
+
+    def __init__(self, base_url, rate, duration, mix, routes, max_in_flight=512, timeout=30, seed=1):
+        self.base_url = base_url.rstrip('/')
+        self.rate = rate
+        self.duration = duration
+        self.endpoints = [e for e in ENDPOINTS if mix[e] > 0]
+        self.weights = [mix[e] for e in self.endpoints]
+        self.routes = routes
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.results = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _send(self, endpoint, scheduled, route):
+        session = self._session()
+        try:
+            if endpoint == 'routing':
+                response = session.post(f'{self.base_url}/routing/route', json=route, timeout=self.timeout)
+            elif endpoint == 'sites':
+                response = session.get(f'{self.base_url}/sites', timeout=self.timeout)
+            else:
+                response = session.get(f'{self.base_url}/heatmap/latest_readings', timeout=self.timeout)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+
+        latency = time.perf_counter() - scheduled
+        with self._lock:
+            self.results.append((endpoint, latency, ok))
+
+    def run(self):
+        """Run the schedule, wait for outstanding requests and return the elapsed seconds."""
+        started = time.perf_counter()
+        next_at = started
+        end_at = started + self.duration
+
+        while True:
+            next_at += self.rng.expovariate(self.rate)
+            if next_at >= end_at:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            self._pool.submit(self._send, endpoint, next_at, self.rng.choice(self.routes))
+
+        self._pool.shutdown(wait=True)
+        return time.perf_counter() - started
+
+
+def serve_in_process(config):
+    """Start the app on a threaded local server. Returns (base_url, server)."""
+    from werkzeug.serving import make_server
+    from app import create_app
+    from extensions import db
+
+    app = create_app(config)
+    with app.app_context():
+        prepare_engine(db.engine)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-app', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=20, help='total requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of traffic')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('routing=1,sites=1,heatmap=1'),
+                        help="endpoint weights, e.g. 'routing=2,sites=1,heatmap=1'")
+    parser.add_argument('--routes', type=int, default=50, help='number of distinct routes requested')
+    parser.add_argument('--sites', type=int, default=200)
+    parser.add_argument('--readings', type=int, default=20000)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in LOADTEST_DATABASE_URL')
+    parser.add_argument('--snapshot', action='store_true', help='serve from a shared readings snapshot')
+    parser.add_argument('--ors-latency', type=float, default=0.15, help='fake ORS mean latency in seconds')
+    parser.add_argument('--ors-jitter', type=float, default=0.05)
+    parser.add_argument('--ors-error-rate', type=float, default=0.0)
+    parser.add_argument('--ors-port', type=int, default=0, help='fixed fake ORS port for an external --target')
+    parser.add_argument('--target', help='base URL of an already running server instead of serving in-process')
+    parser.add_argument('--max-in-flight', type=int, default=512)
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    if not args.target:
+        check_database(loadtest_config(os.getenv('LOADTEST_DATABASE_URL')))
+
+    ors = FakeORS(port=args.ors_port, latency=args.ors_latency, jitter=args.ors_jitter,
+                  error_rate=args.ors_error_rate).start()
+    os.environ['ORS_BASE_URL'] = ors.url
+    print(f'Fake ORS at {ors.url}')
+
+    workdir = tempfile.mkdtemp(prefix='pant-loadtest-')
+    config = loadtest_config(os.getenv('LOADTEST_DATABASE_URL'), os.path.join(workdir, 'loadtest.sqlite'))
+    server = None
+
+    try:
+        if args.target:
+            # The target serves from its own database, seed it with benchmarks/seed_db.py
+            base_url = args.target
+        else:
+            from app import create_app
+            from extensions import db
+            from utils.pollution.snapshot import DB_ONLY_CONFIG, refresh_snapshot
+
+            if args.snapshot:
+                config['SNAPSHOT_PATH'] = os.path.join(workdir, 'readings.snapshot')
+
+            setup = create_app(dict(DB_ONLY_CONFIG, **config))
+            with setup.app_context():
+                prepare_engine(db.engine)
+                if not args.no_seed:
+                    seed(args.sites, args.readings)
+                    print(f'Seeded {args.sites} sites and {args.readings} readings')
+                if args.snapshot:
+                    refresh_snapshot(config['SNAPSHOT_PATH'])
+                db.session.remove()
+
+            base_url, server = serve_in_process(config)
+
+        routes = route_pool(args.routes, DEFAULT_BBOX, random.Random(2))
+        generator = LoadGenerator(base_url, args.rate, args.duration, args.mix, routes, args.max_in_flight)
+        print(f'Driving {args.rate:g} req/s for {args.duration:g}s against {base_url}')
+
+        elapsed = generator.run()
+
+        summary = summarise(generator.results, elapsed)
+        if args.json:
+            print(json.dumps({'elapsed_s': round(elapsed, 2), 'ors_requests': ors.requests, 'endpoints': summary}))
+        else:
+            print_report(summary, elapsed)
+            print(f'Fake ORS served {ors.requests} directions requests')
+    finally:
+        if server is not None:
+            server.shutdown()
+        ors.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Seeds a database with synthetic monitoring sites and pollution readings for load testing.
+Uses PostGIS when LOADTEST_DATABASE_URL points at Postgres, otherwise a SpatiaLite file.
+The load test never touches DATABASE_URL, so a production database cannot be reset by accident.
+
+Usage: python benchmarks/seed_db.py --sites 200 --readings 20000
+Author: Ross Cochrane
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.compiler import compiles
+from geoalchemy2 import WKTElement
+from geoalchemy2.functions import ST_DWithin
+from geoalchemy2.admin.dialects.sqlite import register_sqlite_mapping
+from app import create_app
+from extensions import db
+from models.site import Site
+from models.pollution_reading import PollutionReading
+from utils.pollution.snapshot import DB_ONLY_CONFIG
+
+# Central Newcastle upon Tyne, (min lon, min lat, max lon, max lat)
+DEFAULT_BBOX = (-1.66, 54.96, -1.57, 55.00)
+
+# Spatial functions used by route enrichment that are named differently in SpatiaLite
+register_sqlite_mapping({'ST_Point': 'MakePoint', 'ST_SetSRID': 'SetSRID'})
+
+
+@compiles(ST_DWithin, 'sqlite')
+def _dwithin_spatialite(element, compiler, **kw):
+    """SpatiaLite has no ST_DWithin, compare the planar distance instead."""
+    a, b, distance = element.clauses
+    return '(ST_Distance({}, {}) <= {})'.format(
+        compiler.process(a, **kw), compiler.process(b, **kw), compiler.process(distance, **kw)
+    )
+
+
+def loadtest_config(database_url=None, sqlite_path='loadtest.sqlite'):
+    """
+    Returns create_app config for the load test database.
+    :param database_url: Postgres URL, or None to use a SpatiaLite file at sqlite_path
+    """
+    url = database_url or f'sqlite:///{os.path.abspath(sqlite_path)}'
+    return {'SQLALCHEMY_DATABASE_URI': url}
+
+
+def spatialite_error():
+    """Returns why SpatiaLite cannot be loaded into SQLite here, or None if it can."""
+    if not hasattr(sqlite3.Connection, 'enable_load_extension'):
+        return "this Python's sqlite3 module was built without extension loading"
+
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.enable_load_extension(True)
+        conn.load_extension(os.getenv('SPATIALITE_LIBRARY_PATH', 'mod_spatialite'))
+    except sqlite3.Error as e:
+        return f'mod_spatialite could not be loaded ({e})'
+    finally:
+        conn.close()
+    return None
+
+
+def check_database(config):
+    """
+    Exit with a clear message when the SpatiaLite fallback is selected but cannot work,
+    instead of failing part way through seeding.
+    """
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+    error = spatialite_error()
+    if error:
+        sys.exit(
+            f'Cannot use the SpatiaLite fallback: {error}.\n'
+            'Set LOADTEST_DATABASE_URL to a PostGIS database, or install SpatiaLite '
+            '(e.g. libsqlite3-mod-spatialite) with a Python whose sqlite3 supports extensions.'
+        )
+
+
+def prepare_engine(engine):
+    """Enable the spatial extension for the engine's database."""
+    if engine.dialect.name == 'sqlite':
+        from geoalchemy2 import load_spatialite
+        os.environ.setdefault('SPATIALITE_LIBRARY_PATH', 'mod_spatialite')
+        event.listen(engine, 'connect', lambda conn, _: load_spatialite(conn, init_mode='WGS84'))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS postgis'))
+
+
+def seed(sites=200, readings=20000, bbox=DEFAULT_BBOX, seed=1, batch=5000):
+    """
+    Recreate the sites and readings tables and fill them with synthetic data.
+    Readings are spread evenly over the sites and over the last 24 hours.
+    Must run inside an app context.
+    """
+    rng = random.Random(seed)
+    min_lon, min_lat, max_lon, max_lat = bbox
+
+    PollutionReading.__table__.drop(db.engine, checkfirst=True)
+    Site.__table__.drop(db.engine, checkfirst=True)
+    Site.__table__.create(db.engine)
+    PollutionReading.__table__.create(db.engine)
+
+    site_rows = []
+    for i in range(sites):
+        lon = rng.uniform(min_lon, max_lon)
+        lat = rng.uniform(min_lat, max_lat)
+        site_rows.append({
+            'system_code_number': f'LOADTEST_{i:05d}',
+            'latitude': lat,
+            'longitude': lon,
+            'location': WKTElement(f'POINT({lon} {lat})', srid=4326)
+        })
+    db.session.execute(insert(Site), site_rows)
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    pending = []
+    for i in range(readings):
+        pending.append({
+            'system_code_number': site_rows[i % sites]['system_code_number'],
+            'co': rng.uniform(0.1, 5.0),
+            'no': rng.uniform(1, 150),
+            'no2': rng.uniform(5, 300),
+            'temperature': rng.uniform(5, 25),
+            'rh': rng.uniform(40, 90),
+            'noise': rng.uniform(30, 100),
+            'battery': rng.uniform(20, 100),
+            'last_updated': now - timedelta(seconds=rng.randint(0, 86400))
+        })
+        if len(pending) == batch:
+            db.session.execute(insert(PollutionReading), pending)
+            pending = []
+    if pending:
+        db.session.execute(insert(PollutionReading), pending)
+
+    db.session.commit()
+    return site_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sites', type=int, default=200)
+    parser.add_argument('--readings', type=int, default=20000)
+    parser.add_argument('--sqlite-path', default='loadtest.sqlite')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    config = loadtest_config(os.getenv('LOADTEST_DATABASE_URL'), args.sqlite_path)
+    check_database(config)
+    app = create_app(dict(DB_ONLY_CONFIG, **config))
+    with app.app_context():
+        prepare_engine(db.engine)
+        seed(args.sites, args.readings, seed=args.seed)
+    print(f"Seeded {args.sites} sites and {args.readings} readings into {config['SQLALCHEMY_DATABASE_URI']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Gunicorn configuration.
+Workers are threaded so identical concurrent requests share one computation.
+When SNAPSHOT_PATH is set, the shared readings snapshot is written before any worker
+is forked, and a single refresher process keeps it up to date while workers map it read-only.
+Author: Ross Cochrane
+"""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+wsgi_app = 'app:create_app()'
+
+# Threaded workers, so concurrent identical requests within a worker can be coalesced
+# (see utils/coalesce.py). A sync worker handles one request at a time and never coalesces.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH')
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv('SNAPSHOT_REFRESH_SECONDS', '30'))
+
+refresher = None
+
+
+def on_starting(server):
+    """
+    Pre-fork warmup: write the first snapshot so workers start with data.
+    If the database is unreachable the service still starts, workers query the
+    database directly until the refresher manages to write a snapshot.
+    """
+    if SNAPSHOT_PATH:
+        from utils.pollution.snapshot import warm_snapshot
+        try:
+            warm_snapshot(SNAPSHOT_PATH)
+        except Exception as e:
+            server.log.error(f"Snapshot warmup failed, serving from the database: {e}")
+
+
+def when_ready(server):
+    """Start the single snapshot refresher process."""
+    global refresher
+    if SNAPSHOT_PATH:
+        from utils.pollution.snapshot import start_refresher
+        refresher = start_refresher(SNAPSHOT_PATH, SNAPSHOT_REFRESH_SECONDS)
+
+
+def on_exit(server):
+    """Stop the refresher with the arbiter."""
+    if refresher is not None:
+        refresher.terminate()
+        refresher.join(5)
@@ -1,17 +1,16 @@
 """
 This module defines a Flask Blueprint for the `/heatmap` endpoint.
 It provides a route to retrieve the latest pollution readings from each site.
-The data is fetched using SQLAlchemy ORM, joining pollution readings with site metadata.
+The data is fetched using SQLAlchemy ORM, joining pollution readings with site metadata,
+or from the shared readings snapshot when one is configured.
 Author: Ross Cochrane
 """
 
 
 from flask import Blueprint, jsonify
-from sqlalchemy.orm import aliased
-from sqlalchemy import func, and_
-from extensions import db
-from models.site import Site
-from models.pollution_reading import PollutionReading
+from utils.pollution.latest import query_latest_readings
+from utils.pollution.snapshot import current_snapshot
+from utils.coalesce import get_coalescer
 
 heatmap_bp = Blueprint('heatmap', __name__, url_prefix='/heatmap')
 
@@ -19,39 +18,22 @@ heatmap_bp = Blueprint('heatmap', __name__, url_prefix='/heatmap')
 def get_latest_readings():
     """
     Retrieves the latest pollution from each site.
+    Concurrent requests share a single lookup.
     """
+    return jsonify(get_coalescer().do('latest_readings', None, load_latest_readings))
 
-    # Subquery to get the latest timestamp for each system_code_number
 
-    subquery = db.session.query(
-        PollutionReading.system_code_number,
-        func.max(PollutionReading.last_updated).label('latest')
-    ).group_by(PollutionReading.system_code_number).subquery()
-
-    ReadingAlias = aliased(PollutionReading)
-
-
-    # Main query to fetch site info and corresponding latest pollution readings
+def load_latest_readings():
+    """
+    Loads the latest pollution from each site as a list of dicts.
+    Served from the shared readings snapshot when one is available.
+    """
 
-    results = db.session.query(
-        Site.system_code_number,
-        Site.latitude,
-        Site.longitude,
-        ReadingAlias.co,
-        ReadingAlias.no,
-        ReadingAlias.no2,
-        ReadingAlias.noise,
-        ReadingAlias.last_updated
-    ).join(
-        subquery,
-        Site.system_code_number == subquery.c.system_code_number
-    ).join(
-        ReadingAlias,
-        and_(
-            Site.system_code_number == ReadingAlias.system_code_number,
-            ReadingAlias.last_updated == subquery.c.latest
-        )
-    ).all()
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        results = snapshot.rows(with_readings_only=True)
+    else:
+        results = query_latest_readings()
 
 
     # Format the results
@@ -71,4 +53,4 @@ def get_latest_readings():
             }
         })
 
-    return jsonify(response)
\ No newline at end of file
+    return response
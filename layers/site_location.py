@@ -7,6 +7,8 @@ Author: Ross Cochrane
 from flask import Blueprint, jsonify
 from models.site import Site
 from extensions import db
+from utils.pollution.snapshot import current_snapshot
+from utils.coalesce import get_coalescer
 
 # Define a new Blueprint for site-related routes
 sites_bp = Blueprint('sites', __name__)
@@ -16,9 +18,19 @@ sites_bp = Blueprint('sites', __name__)
 def get_all_sites():
     """
     Returns all monitoring sites from the database as GeoJSON.
+    Concurrent requests share a single lookup.
     """
-    
-    all_sites = Site.query.all()
+    return jsonify(get_coalescer().do('sites', None, load_sites_geojson)), 200
+
+
+def load_sites_geojson():
+    """
+    Builds a GeoJSON FeatureCollection of all monitoring sites.
+    Served from the shared readings snapshot when one is available.
+    """
+
+    snapshot = current_snapshot()
+    all_sites = snapshot.rows() if snapshot is not None else Site.query.all()
 
     # Build a GeoJSON FeatureCollection
     features = []
@@ -40,4 +52,4 @@ def get_all_sites():
         "features": features
     }
 
-    return jsonify(geojson), 200
\ No newline at end of file
+    return geojson
@@ -0,0 +1,17 @@
+"""
+Provides a Flask Blueprint exposing runtime metrics for this worker.
+Author: Ross Cochrane
+"""
+
+from flask import Blueprint, jsonify
+from utils.coalesce import get_coalescer
+
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/metrics')
+
+
+@metrics_bp.route('/coalescing', methods=['GET'])
+def get_coalescing_metrics():
+    """
+    Returns request coalescing counts and ratio per endpoint for this worker process.
+    """
+    return jsonify(get_coalescer().stats()), 200
@@ -5,43 +5,172 @@ Each route is enriched with pollution metrics, and the cleanest route is returne
 Author: Ross Cochrane
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 import openrouteservice
+import json
 import math
 import os
 
-from utils.pollution.aqi import compute_aqi
-from utils.routes.enrichment import enrich_route_with_pollution
+from utils.pollution.aqi import compute_aqi, POLLUTANTS
+from utils.routes.enrichment import enrich_route_with_pollution, SCORING_MODES
+from utils.routes import encoding
+from utils.coalesce import get_coalescer
 
 routing_bp = Blueprint('routing', __name__)
 
+ORS_BASE_URL = 'https://api.openrouteservice.org'
+
+# Media types the route response can be negotiated to, GeoJSON first as the default
+GEOJSON_MIMETYPE = 'application/geo+json'
+COMPACT_JSON_MIMETYPE = 'application/vnd.pant.route+json'
+COMPACT_MSGPACK_MIMETYPE = 'application/vnd.pant.route+msgpack'
+
+
+def parse_pollutants(value):
+    """
+    Normalise the 'pollutant' request field into a list of pollutant names.
+    Accepts a single pollutant, a list of pollutants or 'all'.
+    A single pollutant is passed through unchecked, as before lists were supported,
+    but every entry in a list must be a known pollutant.
+    Returns None if the value is not valid.
+    """
+    if isinstance(value, str):
+        if value.lower() == 'all':
+            return list(POLLUTANTS)
+        return [value.lower()]
+    if isinstance(value, list) and value and all(isinstance(p, str) for p in value):
+        pollutants = list(dict.fromkeys(p.lower() for p in value))
+        if all(p in POLLUTANTS for p in pollutants):
+            return pollutants
+    return None
+
+
+def parse_coordinate(value):
+    """Normalise a [lon, lat] request field to floats. Returns None if the value is not valid."""
+    if not isinstance(value, list) or len(value) != 2:
+        return None
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+        return None
+    return [float(value[0]), float(value[1])]
+
+
+def round_score(score):
+    """Round a score for JSON output, mapping missing, infinite or NaN values to None."""
+    if score is None or math.isinf(score) or math.isnan(score):
+        return None
+    return round(score, 2)
+
+
+def get_ors_client():
+    """
+    Return the ORS client for the current app.
+    It is created on first use and reused, so its HTTP session is kept across requests.
+    ORS_BASE_URL can point the client at a self-hosted or stand-in ORS server.
+    """
+    client = current_app.extensions.get('ors_client')
+    if client is None:
+        ors_key = os.getenv('ORS_API_KEY')
+        base_url = os.getenv('ORS_BASE_URL', ORS_BASE_URL)
+        if not ors_key and base_url == ORS_BASE_URL:
+            print("Error: ORS_API_KEY environment not set.")
+        client = openrouteservice.Client(key=ors_key, base_url=base_url)
+        current_app.extensions['ors_client'] = client
+    return client
+
+
+def route_response(route_geojson):
+    """
+    Serialise the selected route according to the request's Accept header.
+    GeoJSON is returned unless a compact encoding is explicitly preferred.
+    """
+    offered = ['application/json', GEOJSON_MIMETYPE, COMPACT_JSON_MIMETYPE]
+    if encoding.msgpack is not None:
+        offered.append(COMPACT_MSGPACK_MIMETYPE)
+
+    mimetype = request.accept_mimetypes.best_match(offered)
+
+    if mimetype == COMPACT_MSGPACK_MIMETYPE:
+        body = encoding.pack_msgpack(encoding.compact_route(route_geojson))
+        response = Response(body, status=200, mimetype=mimetype)
+    elif mimetype == COMPACT_JSON_MIMETYPE:
+        response = jsonify(encoding.compact_route(route_geojson, binary=False))
+        response.mimetype = mimetype
+    else:
+        response = jsonify(route_geojson)
+
+    response.vary.add('Accept')
+    return response, 200
+
 @routing_bp.route('/routing/route', methods=['POST'])  
 def generate_route():
     """
     Generate a base route, then simulate 3 alternatives by inserting offset waypoints
     at ¼, ½, and ¾ of the base route. Each route is enriched with pollution data.
     The cleanest route is returned as a GEOJson
+
+    'pollutant' may be a single pollutant, a list of pollutants or 'all'. When several
+    are requested, each is scored from the same readings and the route is selected
+    on 'primary_pollutant' (defaults to the first pollutant in the list).
+
+    'scoring' selects 'radius' (latest reading within 200m) or 'knn' (distance-weighted
+    interpolation between the nearest sites). Defaults to the ROUTE_SCORING config value.
     """
     data = request.get_json()
     required_keys = {'start', 'end', 'mode', 'pollutant'}
     if not data or not required_keys.issubset(data):
         return jsonify({'error': 'Missing required input fields'}), 400
 
-    start = data['start']
-    end = data['end']
+    start = parse_coordinate(data['start'])
+    end = parse_coordinate(data['end'])
+    if start is None or end is None:
+        return jsonify({'error': 'start and end must be [lon, lat] numbers'}), 400
     mode = data['mode']
-    pollutant = data['pollutant']
+    pollutants = parse_pollutants(data['pollutant'])
+    if pollutants is None:
+        return jsonify({'error': f"pollutant must be one of {', '.join(POLLUTANTS)}, a list of them or 'all'"}), 400
+
+    pollutant = data.get('primary_pollutant', pollutants[0])
+    if 'primary_pollutant' in data and (not isinstance(pollutant, str) or pollutant.lower() not in POLLUTANTS):
+        return jsonify({'error': f"primary_pollutant must be one of {', '.join(POLLUTANTS)}"}), 400
+    if not isinstance(pollutant, str) or pollutant.lower() not in pollutants:
+        return jsonify({'error': 'primary_pollutant must be one of the requested pollutants'}), 400
+    pollutant = pollutant.lower()
+
+    # Only score extra pollutants when more than the single legacy pollutant was asked for.
+    # They are put in POLLUTANTS order so equivalent requests coalesce.
+    extra_pollutants = None
+    if isinstance(data['pollutant'], list) or len(pollutants) > 1:
+        extra_pollutants = sorted(pollutants, key=POLLUTANTS.index)
+
+    scoring = data.get('scoring', current_app.config.get('ROUTE_SCORING', 'radius'))
+    scoring = scoring.lower() if isinstance(scoring, str) else scoring
+    if scoring not in SCORING_MODES:
+        return jsonify({'error': f"scoring must be one of {', '.join(SCORING_MODES)}"}), 400
+
+    # Identical concurrent requests share one set of ORS calls and enrichment queries.
+    # The key is built from the normalised values, so [8, 49] and [8.0, 49.0] match.
+    key = json.dumps([start, end, mode, pollutant, extra_pollutants, scoring])
+    payload, status = get_coalescer().do(
+        'route', key, lambda: build_route(start, end, mode, pollutant, extra_pollutants, scoring)
+    )
+
+    if status != 200:
+        return jsonify(payload), status
+    return route_response(payload)
+
+
+def build_route(start, end, mode, pollutant, extra_pollutants, scoring='radius'):
+    """
+    Request the base and alternative routes from ORS, enrich them and select the cleanest.
+    :return: (payload, status) where payload is the best route GeoJSON or an error dict
+    """
 
     def offset(coord, dx, dy):
         """Offset a coordinate by dx/dy degrees (~meters)."""
         return [coord[0] + dx, coord[1] + dy]
 
     # Initialize ORS client
-    ors_key = os.getenv('ORS_API_KEY')
-    if not ors_key:
-        print("Error: ORS_API_KEY environment not set.")
-        
-    client = openrouteservice.Client(key=os.getenv('ORS_API_KEY'))
+    client = get_ors_client()
 
     enriched_routes = []
 
@@ -52,16 +181,16 @@ def generate_route():
             profile=mode,
             format='geojson'
         )
-        enriched_base = enrich_route_with_pollution(base_route, pollutant)
+        enriched_base = enrich_route_with_pollution(base_route, pollutant, extra_pollutants, scoring=scoring)
         enriched_routes.append(enriched_base)
 
     except openrouteservice.exceptions.ApiError as e:
-        return jsonify({'error': f'ORS API error: {str(e)}'}), 502
+        return {'error': f'ORS API error: {str(e)}'}, 502
 
     # Step 2: Extract base route coordinates
     coords = base_route['features'][0]['geometry']['coordinates']
     if len(coords) < 4:
-        return jsonify({'error': 'Base route too short to extract waypoints'}), 400
+        return {'error': 'Base route too short to extract waypoints'}, 400
 
     # Step 3: Define offset waypoints
     wp1 = offset(coords[len(coords) // 4], 0.0003, 0.0002)  # ~20–50m
@@ -78,7 +207,7 @@ def generate_route():
                 profile=mode,
                 format='geojson'
             )
-            enriched = enrich_route_with_pollution(route, pollutant)
+            enriched = enrich_route_with_pollution(route, pollutant, extra_pollutants, scoring=scoring)
             enriched_routes.append(enriched)
 
         except openrouteservice.exceptions.ApiError:
@@ -95,15 +224,19 @@ def generate_route():
     avg_score = average_pollution_score(best_route)
 
     # Prevent an infinite being returned
-    if math.isinf(avg_score) or math.isnan(avg_score):
-        avg_score_json = None
-    else:
-        avg_score_json = round(avg_score, 2)
+    avg_score_json = round_score(avg_score)
+
+    current_app.logger.debug('Pollution scores: %s', best_route['features'][0]['properties']['pollution_scores'])
+    current_app.logger.debug('Average pollution score: %s', avg_score_json)
 
-    # debuggin
-    print('Pollution scores:', best_route['features'][0]['properties']['pollution_scores'])
-    print('Average pollution score:', avg_score_json)
+    best_properties = best_route['features'][0]['properties']
+    best_properties['average_pollution_score'] = avg_score_json
 
-    best_route['features'][0]['properties']['average_pollution_score'] = avg_score_json
+    if extra_pollutants:
+        best_properties['primary_pollutant'] = pollutant
+        best_properties['average_pollutant_scores'] = {
+            p: round_score(score)
+            for p, score in best_properties.get('average_pollutant_scores', {}).items()
+        }
 
-    return jsonify(best_route), 200
+    return best_route, 200
@@ -0,0 +1,82 @@
+"""
+Module to test the application factory.
+Author: Ross Cochrane
+"""
+
+import unittest
+import subprocess
+import sys
+import os
+import json
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(ROOT)
+
+from app import create_app
+
+# Budget for building a heatmap-only app in a fresh interpreter, imports included
+STARTUP_BUDGET_SECONDS = 3.0
+
+TEST_CONFIG = {'SQLALCHEMY_DATABASE_URI': 'sqlite://'}
+
+
+class TestCreateApp(unittest.TestCase):
+    """Unit tests for create_app"""
+
+    def test_all_blueprints_registered_by_default(self):
+        """Test that every blueprint is registered when no flags are set"""
+        app = create_app(TEST_CONFIG)
+        self.assertEqual(set(app.blueprints), {'routing', 'sites', 'heatmap', 'metrics'})
+
+    def test_blueprint_flags(self):
+        """Test that disabled blueprints are not registered"""
+        app = create_app(dict(TEST_CONFIG, ENABLE_ROUTING=False, ENABLE_SITES=False, ENABLE_METRICS=False))
+        self.assertEqual(set(app.blueprints), {'heatmap'})
+        self.assertIn('STARTUP_SECONDS', app.config)
+
+    def test_route_scoring_config(self):
+        """Test that ROUTE_SCORING is normalised and an unknown mode fails at startup"""
+        app = create_app(dict(TEST_CONFIG, ROUTE_SCORING='KNN'))
+        self.assertEqual(app.config['ROUTE_SCORING'], 'knn')
+
+        with self.assertRaises(ValueError):
+            create_app(dict(TEST_CONFIG, ROUTE_SCORING='knnn'))
+
+    def test_knn_config(self):
+        """Test that invalid k-nearest-site settings fail at startup"""
+        with self.assertRaises(ValueError):
+            create_app(dict(TEST_CONFIG, KNN_NEIGHBOURS=0))
+        with self.assertRaises(ValueError):
+            create_app(dict(TEST_CONFIG, KNN_MAX_RADIUS_M=0))
+        with self.assertRaises(ValueError):
+            create_app(dict(TEST_CONFIG, KNN_POWER=0))
+        with self.assertRaises(ValueError):
+            create_app(dict(TEST_CONFIG, SITE_INDEX_TTL=-1))
+
+    def test_heatmap_only_startup(self):
+        """
+        Test in a fresh interpreter that a heatmap-only app never imports the
+        routing dependencies and is built within the startup budget.
+        """
+        script = (
+            "import sys, time, json\n"
+            "started = time.perf_counter()\n"
+            "from app import create_app\n"
+            "create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://',"
+            " 'ENABLE_ROUTING': False, 'ENABLE_SITES': False})\n"
+            "print(json.dumps({'seconds': time.perf_counter() - started,"
+            " 'ors': 'openrouteservice' in sys.modules,"
+            " 'routing': 'routes.routing' in sys.modules}))\n"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        self.assertFalse(result['ors'], "openrouteservice should not be imported")
+        self.assertFalse(result['routing'], "routing blueprint should not be imported")
+        self.assertLess(result['seconds'], STARTUP_BUDGET_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
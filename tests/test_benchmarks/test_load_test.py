@@ -0,0 +1,113 @@
+"""
+Module to test the load test harness.
+Author: Ross Cochrane
+"""
+
+import unittest
+from unittest.mock import patch
+import threading
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../benchmarks')))
+
+import openrouteservice
+from flask import Flask, jsonify
+from werkzeug.serving import make_server
+from fake_ors import FakeORS
+from load_test import LoadGenerator, percentile, summarise, parse_mix
+from seed_db import check_database, loadtest_config
+
+
+class TestFakeORS(unittest.TestCase):
+    """Tests for the fake ORS server"""
+
+    def setUp(self):
+        """Start the fake ORS server without latency"""
+        self.ors = FakeORS(latency=0, jitter=0).start()
+        self.addCleanup(self.ors.stop)
+
+    def test_directions_through_waypoints(self):
+        """Test that the ORS client gets a street-like route through every waypoint"""
+        client = openrouteservice.Client(base_url=self.ors.url)
+        coordinates = [[-1.61, 54.97], [-1.605, 54.975], [-1.60, 54.98]]
+
+        route = client.directions(coordinates=coordinates, profile='foot-walking', format='geojson')
+
+        feature = route['features'][0]
+        geometry = feature['geometry']['coordinates']
+        self.assertEqual(geometry[0], coordinates[0])
+        self.assertEqual(geometry[-1], coordinates[-1])
+        self.assertGreater(len(geometry), 20)
+        self.assertEqual(len(feature['properties']['segments']), 2)
+        self.assertGreater(feature['properties']['summary']['distance'], 0)
+        self.assertEqual(self.ors.requests, 1)
+
+    def test_simulated_errors(self):
+        """Test that the error rate produces ORS API errors"""
+        self.ors.error_rate = 1.0
+        client = openrouteservice.Client(base_url=self.ors.url, retry_over_query_limit=False)
+
+        with self.assertRaises(openrouteservice.exceptions.ApiError):
+            client.directions(coordinates=[[-1.61, 54.97], [-1.60, 54.98]], profile='foot-walking', format='geojson')
+
+
+class TestLoadGenerator(unittest.TestCase):
+    """Tests for traffic generation and reporting"""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_parse_mix(self):
+        """Test endpoint weights, unlisted endpoints get no traffic"""
+        self.assertEqual(parse_mix('routing=2,heatmap'), {'routing': 2.0, 'sites': 0.0, 'heatmap': 1.0})
+
+    def test_run_against_server(self):
+        """Test that traffic reaches every endpoint and errors are counted"""
+        app = Flask(__name__)
+        app.add_url_rule('/sites', 'sites', lambda: jsonify({'features': []}))
+        app.add_url_rule('/heatmap/latest_readings', 'heatmap', lambda: (jsonify({'error': 'down'}), 500))
+        app.add_url_rule('/routing/route', 'route', lambda: jsonify({'features': []}), methods=['POST'])
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+
+        generator = LoadGenerator(
+            f'http://127.0.0.1:{server.server_port}', rate=300, duration=0.5,
+            mix=parse_mix('routing=1,sites=1,heatmap=1'), routes=[{'start': [0, 0]}]
+        )
+        elapsed = generator.run()
+        summary = summarise(generator.results, elapsed)
+
+        self.assertEqual(set(summary), {'routing', 'sites', 'heatmap'})
+        self.assertEqual(summary['sites']['errors'], 0)
+        self.assertEqual(summary['heatmap']['error_rate'], 1.0)
+        self.assertGreater(summary['routing']['throughput_rps'], 0)
+        self.assertLessEqual(summary['routing']['p50_ms'], summary['routing']['p99_ms'])
+
+
+class TestCheckDatabase(unittest.TestCase):
+    """Tests for the load test database check"""
+
+    @patch("seed_db.spatialite_error", return_value="mod_spatialite could not be loaded")
+    def test_spatialite_unavailable(self, mock_error):
+        """Test that the SpatiaLite fallback exits with a message naming LOADTEST_DATABASE_URL"""
+        with self.assertRaises(SystemExit) as raised:
+            check_database(loadtest_config(None, 'loadtest.sqlite'))
+        self.assertIn("LOADTEST_DATABASE_URL", str(raised.exception.code))
+
+    @patch("seed_db.spatialite_error", return_value="mod_spatialite could not be loaded")
+    def test_postgres_not_checked(self, mock_error):
+        """Test that a PostGIS database is not checked for SpatiaLite"""
+        check_database(loadtest_config("postgresql://localhost/loadtest"))
+        mock_error.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,14 +5,28 @@ Author: Ross Cochrane
 
 import unittest
 from unittest.mock import patch, MagicMock
+import threading
+import time
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 from flask import Flask, json
 from routes.routing import routing_bp
+from utils.routes import encoding
 
 
+def make_route(pollution_scores, **properties):
+    """Build a 5-vertex ORS route GeoJSON with the given enrichment properties"""
+    return {
+        "features": [{
+            "geometry": {
+                "coordinates": [[1, 1], [2, 2], [3, 3], [4, 4], [5, 5]]
+            },
+            "properties": dict(properties, pollution_scores=pollution_scores)
+        }]
+    }
+
 
 class TestGenerateRoute(unittest.TestCase):
     """Unit tests for the generate_route endpoint in routing.py"""
@@ -30,6 +44,14 @@ class TestGenerateRoute(unittest.TestCase):
             "pollutant": "pm25"
         }
 
+    def mock_ors(self, mock_ors_client, mock_enrich, route):
+        """Make every ORS directions call and every enrichment return route. Returns the client mock"""
+        mock_enrich.return_value = route
+        mock_client_instance = MagicMock()
+        mock_client_instance.directions.return_value = route
+        mock_ors_client.return_value = mock_client_instance
+        return mock_client_instance
+
     @patch("routes.routing.openrouteservice.Client")
     @patch("routes.routing.enrich_route_with_pollution")
     def test_generate_route_success(self, mock_enrich, mock_ors_client):
@@ -64,6 +86,203 @@ class TestGenerateRoute(unittest.TestCase):
         self.assertIn("average_pollution_score", data["features"][0]["properties"])
         self.assertEqual(data["features"][0]["properties"]["average_pollution_score"], 20.0)
 
+    @patch("routes.routing.openrouteservice.Client")
+    @patch("routes.routing.enrich_route_with_pollution")
+    def test_generate_route_multiple_pollutants(self, mock_enrich, mock_ors_client):
+        """Test that 'all' scores every pollutant and selects on the primary pollutant"""
+        route = make_route([1.0, 2.0, 3.0], average_pollutant_scores={"co": 1.234, "no2": 2.0, "noise": None})
+        self.mock_ors(mock_ors_client, mock_enrich, route)
+
+        payload = dict(self.valid_payload, pollutant="all", primary_pollutant="no2")
+        response = self.client.post(
+            "/routing/route",
+            data=json.dumps(payload),
+            content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        args = mock_enrich.call_args[0]
+        self.assertEqual(args[1], "no2")
+        self.assertEqual(args[2], ["co", "no", "no2", "noise", "aqi"])
+
+        properties = response.get_json()["features"][0]["properties"]
+        self.assertEqual(properties["primary_pollutant"], "no2")
+        self.assertEqual(properties["average_pollutant_scores"], {"co": 1.23, "no2": 2.0, "noise": None})
+
+    def test_invalid_primary_pollutant(self):
+        """Test that a primary pollutant outside the requested list is rejected"""
+        payload = dict(self.valid_payload, pollutant=["co", "no2"], primary_pollutant="noise")
+
+        response = self.client.post(
+            "/routing/route",
+            data=json.dumps(payload),
+            content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.get_json())
+
+    def test_unknown_pollutant_in_list(self):
+        """Test that unknown pollutants in a list, or as the primary pollutant, are rejected"""
+        for payload in (
+            dict(self.valid_payload, pollutant=["co", "pm25"], primary_pollutant="pm25"),
+            dict(self.valid_payload, pollutant=["co", "pm25"]),
+            dict(self.valid_payload, pollutant="all", primary_pollutant="pm25")
+        ):
+            response = self.client.post(
+                "/routing/route",
+                data=json.dumps(payload),
+                content_type="application/json"
+            )
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("error", response.get_json())
+
+    @patch("routes.routing.openrouteservice.Client")
+    @patch("routes.routing.enrich_route_with_pollution")
+    def test_generate_route_compact(self, mock_enrich, mock_ors_client):
+        """Test that the compact encoding is returned when requested via Accept"""
+        self.mock_ors(mock_ors_client, mock_enrich, make_route([1.0, 2.0, 3.0]))
+
+        response = self.client.post(
+            "/routing/route",
+            data=json.dumps(self.valid_payload),
+            content_type="application/json",
+            headers={"Accept": "application/vnd.pant.route+json"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/vnd.pant.route+json")
+        self.assertIn("Accept", response.headers.get("Vary", ""))
+        data = json.loads(response.data)
+        self.assertIn("polyline", data)
+        self.assertNotIn("features", data)
+        self.assertEqual(data["average_pollution_score"], 2.0)
+
+    @unittest.skipUnless(encoding.msgpack, "msgpack is not installed")
+    @patch("routes.routing.openrouteservice.Client")
+    @patch("routes.routing.enrich_route_with_pollution")
+    def test_generate_route_msgpack(self, mock_enrich, mock_ors_client):
+        """Test that MessagePack is returned when requested via Accept, with raw score bytes"""
+        self.mock_ors(mock_ors_client, mock_enrich, make_route([1.0, None, 10.0]))
+
+        response = self.client.post(
+            "/routing/route",
+            data=json.dumps(self.valid_payload),
+            content_type="application/json",
+            headers={"Accept": "application/vnd.pant.route+msgpack"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/vnd.pant.route+msgpack")
+        data = encoding.msgpack.unpackb(response.data, raw=False)
+        self.assertEqual(data["format"], encoding.COMPACT_FORMAT)
+        self.assertEqual(data["precision"], encoding.POLYLINE_PRECISION)
+        self.assertEqual(data["pollution_scores"], bytes([25, encoding.MISSING_SCORE, 254]))
+        self.assertEqual(data["average_pollution_score"], 5.5)
+
+    @patch("routes.routing.openrouteservice.Client")
+    @patch("routes.routing.enrich_route_with_pollution")
+    def test_generate_route_knn_scoring(self, mock_enrich, mock_ors_client):
+        """Test that the scoring mode is normalised and passed through to enrichment"""
+        self.mock_ors(mock_ors_client, mock_enrich, make_route([1.0, 2.0, 3.0]))
+
+        response = self.client.post(
+            "/routing/route",
+            data=json.dumps(dict(self.valid_payload, scoring="KNN")),
+            content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_enrich.call_args[1]["scoring"], "knn")
+
+    def test_invalid_scoring(self):
+        """Test that an unknown scoring mode is rejected"""
+        response = self.client.post(
+            "/routing/route",
+            data=json.dumps(dict(self.valid_payload, scoring="nearest")),
+            content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.get_json())
+
+    def post_concurrently(self, mock_ors_client, payloads):
+        """
+        Post the payloads from separate threads while ORS is blocked, releasing it once every
+        request has reached the coalescer. Returns the responses and the ORS client mock.
+        """
+        route = make_route([1.0, 2.0, 3.0])
+        release = threading.Event()
+
+        def directions(**kwargs):
+            release.wait(5)
+            return route
+
+        mock_client_instance = MagicMock()
+        mock_client_instance.directions.side_effect = directions
+        mock_ors_client.return_value = mock_client_instance
+
+        responses = []
+
+        def post(payload):
+            responses.append(self.app.test_client().post(
+                "/routing/route",
+                data=json.dumps(payload),
+                content_type="application/json"
+            ))
+
+        threads = [threading.Thread(target=post, args=(payload,)) for payload in payloads]
+        for thread in threads:
+            thread.start()
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            coalescer = self.app.extensions.get("coalescer")
+            if coalescer and coalescer.stats().get("route", {}).get("requests") == len(payloads):
+                break
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return responses, mock_client_instance
+
+    @patch("routes.routing.openrouteservice.Client")
+    @patch("routes.routing.enrich_route_with_pollution", side_effect=lambda route, *args, **kwargs: route)
+    def test_concurrent_identical_requests_coalesced(self, mock_enrich, mock_ors_client):
+        """Test that concurrent identical route requests share one set of ORS calls"""
+        responses, client = self.post_concurrently(mock_ors_client, [self.valid_payload] * 2)
+
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[0].get_json(), responses[1].get_json())
+        # One base route and three alternatives, not one set per request
+        self.assertEqual(client.directions.call_count, 4)
+        self.assertEqual(self.app.extensions["coalescer"].stats()["route"]["coalesced"], 1)
+
+    @patch("routes.routing.openrouteservice.Client")
+    @patch("routes.routing.enrich_route_with_pollution", side_effect=lambda route, *args, **kwargs: route)
+    def test_equivalent_requests_coalesced(self, mock_enrich, mock_ors_client):
+        """Test that requests differing only in number format or pollutant order share a key"""
+        first = dict(self.valid_payload, start=[8, 49], pollutant=["co", "no2"], primary_pollutant="no2")
+        second = dict(self.valid_payload, start=[8.0, 49.0], pollutant=["no2", "co"], primary_pollutant="no2")
+
+        responses, client = self.post_concurrently(mock_ors_client, [first, second])
+
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(client.directions.call_count, 4)
+        self.assertEqual(mock_enrich.call_args[0][2], ["co", "no2"])
+
+    def test_invalid_coordinates(self):
+        """Test that non-numeric start or end coordinates are rejected"""
+        response = self.client.post(
+            "/routing/route",
+            data=json.dumps(dict(self.valid_payload, start=["8.68", "49.41"])),
+            content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.get_json())
+
     def test_missing_fields(self):
         """Test request with missing required fields"""
         incomplete_payload = {
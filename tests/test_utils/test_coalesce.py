@@ -0,0 +1,100 @@
+"""
+Module to test request coalescing.
+Author: Ross Cochrane
+"""
+
+import unittest
+import threading
+import time
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from flask import Flask
+from utils.coalesce import SingleFlight
+from routes.metrics import metrics_bp
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Unit tests for the SingleFlight coalescer"""
+
+    def run_concurrently(self, coalescer, key, fn, callers=5):
+        """Start callers threads for the same key while fn is blocked, then release it"""
+        release = threading.Event()
+        started = threading.Event()
+        results = []
+
+        def blocked():
+            started.set()
+            release.wait(5)
+            return fn()
+
+        def call():
+            try:
+                results.append(coalescer.do('test', key, blocked))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+
+        # Wait until every follower has registered before releasing the leader
+        while coalescer.stats()['test']['requests'] < callers:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_calls_share_result(self):
+        """Test that concurrent identical calls run the computation once"""
+        coalescer = SingleFlight()
+        executions = []
+
+        results = self.run_concurrently(coalescer, 'key', lambda: executions.append(1) or 'route')
+
+        self.assertEqual(results, ['route'] * 5)
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(
+            coalescer.stats()['test'],
+            {'requests': 5, 'executions': 1, 'coalesced': 4, 'coalescing_ratio': 0.8}
+        )
+
+    def test_error_shared_with_waiters(self):
+        """Test that every waiting caller receives the leader's exception"""
+        coalescer = SingleFlight()
+
+        def fail():
+            raise ValueError('ORS unavailable')
+
+        results = self.run_concurrently(coalescer, 'key', fail, callers=3)
+
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+    def test_sequential_calls_not_coalesced(self):
+        """Test that a finished computation is not reused by later calls"""
+        coalescer = SingleFlight()
+        self.assertEqual(coalescer.do('test', 'key', lambda: 1), 1)
+        self.assertEqual(coalescer.do('test', 'key', lambda: 2), 2)
+        self.assertEqual(coalescer.stats()['test']['coalescing_ratio'], 0.0)
+
+    def test_metrics_endpoint(self):
+        """Test that the metrics endpoint reports the app's coalescing stats"""
+        app = Flask(__name__)
+        app.register_blueprint(metrics_bp)
+        coalescer = app.extensions['coalescer'] = SingleFlight()
+        coalescer.do('sites', None, lambda: {})
+
+        response = app.test_client().get('/metrics/coalescing')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['sites']['executions'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Module to test the in-memory site index and k-nearest-site scoring.
+Author: Ross Cochrane
+"""
+
+import unittest
+import random
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from flask import Flask
+from utils.pollution.aqi import normalise_co
+from utils.pollution.site_index import SiteIndex, current_site_index
+
+
+def make_site(code, lon, lat, co=None):
+    """Build a site row with a CO reading"""
+    return SimpleNamespace(
+        system_code_number=code, longitude=lon, latitude=lat,
+        co=co, no=None, no2=None, noise=None
+    )
+
+
+class TestSiteIndex(unittest.TestCase):
+    """Unit tests for SiteIndex"""
+
+    def test_nearest_matches_brute_force(self):
+        """Test grid lookups return the same neighbours as checking every site"""
+        rng = random.Random(3)
+        sites = [make_site(f'S{i}', rng.uniform(-1.66, -1.57), rng.uniform(54.96, 55.00), 1.0)
+                 for i in range(300)]
+        index = SiteIndex(sites, cell_size=250)
+
+        for _ in range(50):
+            lon, lat = rng.uniform(-1.66, -1.57), rng.uniform(54.96, 55.00)
+            expected = sorted(
+                (index.distance(lon, lat, i), i) for i in range(len(index))
+                if index.distance(lon, lat, i) <= 800
+            )[:4]
+            self.assertEqual(index.nearest(lon, lat, k=4, max_radius=800), expected)
+
+    def test_nearest_away_from_mean_latitude(self):
+        """Test lookups far from the sites' mean latitude, where longitude cells are narrower"""
+        rng = random.Random(3)
+        sites = [make_site(f'S{i}', rng.uniform(0.0, 0.1), rng.choice([0.0, 60.0]) + rng.uniform(0.0, 0.05), 1.0)
+                 for i in range(400)]
+        index = SiteIndex(sites, cell_size=500)
+
+        for _ in range(200):
+            lon, lat = rng.uniform(0.0, 0.1), 60.0 + rng.uniform(0.0, 0.05)
+            expected = sorted(
+                (index.distance(lon, lat, i), i) for i in range(len(index))
+                if index.distance(lon, lat, i) <= 3000
+            )[:3]
+            self.assertEqual(index.nearest(lon, lat, k=3, max_radius=3000), expected)
+
+    def test_max_radius(self):
+        """Test that sites beyond the maximum radius are ignored"""
+        # ~110m and ~1.1km north of the point
+        index = SiteIndex([make_site('NEAR', 0.0, 0.001, 1.0), make_site('FAR', 0.0, 0.01, 1.0)])
+        neighbours = index.nearest(0.0, 0.0, k=3, max_radius=500)
+        self.assertEqual([index.readings[i].system_code_number for _, i in neighbours], ['NEAR'])
+        self.assertEqual(index.nearest(5.0, 5.0, k=3, max_radius=500), [])
+
+    def test_interpolate(self):
+        """Test inverse distance weighting of site scores"""
+        index = SiteIndex([make_site('A', 0.0, 0.001, 1.0), make_site('B', 0.0, -0.001, 5.0),
+                           make_site('C', 0.0, 0.003, None)])
+
+        # Equal distances give the mean
+        neighbours = index.nearest(0.0, 0.0, k=2)
+        self.assertAlmostEqual(
+            index.interpolate(neighbours, 'co'), (normalise_co(1.0) + normalise_co(5.0)) / 2
+        )
+
+        # A site at the vertex dominates
+        at_site = index.interpolate(index.nearest(0.0, 0.001, k=3), 'co')
+        self.assertAlmostEqual(at_site, normalise_co(1.0), places=2)
+
+        # Scores are rounded like radius scores, never e.g. 4.999999999999999
+        uneven = index.interpolate([(100.0, 0), (300.0, 1)], 'co')
+        self.assertEqual(uneven, round(uneven, 2))
+
+        # Unknown pollutants and no neighbours give None
+        self.assertIsNone(index.interpolate(neighbours, 'ozone'))
+        self.assertIsNone(index.interpolate([], 'co'))
+
+    def test_current_site_index_cached(self):
+        """Test that the index is built once per TTL from the database"""
+        app = Flask(__name__)
+        rows = [make_site('A', 0.0, 0.0, 1.0)]
+
+        with app.app_context(), patch(
+            "utils.pollution.site_index.query_latest_readings", return_value=rows
+        ) as mock_query:
+            first = current_site_index()
+            self.assertIs(current_site_index(), first)
+            self.assertEqual(mock_query.call_count, 1)
+
+            app.config['SITE_INDEX_TTL'] = 0
+            self.assertIsNot(current_site_index(), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Module to test the shared readings snapshot.
+Author: Ross Cochrane
+"""
+
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from flask import Flask
+from utils.pollution.snapshot import (
+    write_snapshot,
+    read_generation,
+    SnapshotReader,
+    SnapshotRow,
+    HEADER
+)
+from layers.heat_map import heatmap_bp
+from layers.site_location import sites_bp
+
+
+def make_row(code, lat, lon, co=None, no=None, no2=None, noise=None, last_updated=None):
+    """Build a row shaped like the latest readings query"""
+    return SimpleNamespace(
+        system_code_number=code, latitude=lat, longitude=lon,
+        co=co, no=no, no2=no2, noise=noise, last_updated=last_updated
+    )
+
+
+class TestReadingsSnapshot(unittest.TestCase):
+    """Unit tests for writing, mapping and swapping snapshots"""
+
+    def setUp(self):
+        """Create a temporary directory for the snapshot file"""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'readings.snapshot')
+        self.rows = [
+            make_row('SITE1', 54.97, -1.61, co=1.5, no=20.0, no2=40.0, noise=55.0,
+                     last_updated=datetime(2025, 7, 1, 12, 30, 15, 250000)),
+            make_row('SITE2', 54.98, -1.62)
+        ]
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """Test that rows read back from the mapping match what was written"""
+        write_snapshot(self.path, self.rows, 1)
+        snapshot = SnapshotReader(self.path).get()
+
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(snapshot.generation, 1)
+        self.assertEqual(snapshot.index, {'SITE1': 0, 'SITE2': 1})
+        self.assertEqual(
+            snapshot.row(0),
+            SnapshotRow('SITE1', 54.97, -1.61, 1.5, 20.0, 40.0, 55.0,
+                        datetime(2025, 7, 1, 12, 30, 15, 250000))
+        )
+        self.assertEqual(snapshot.row(1), SnapshotRow('SITE2', 54.98, -1.62, None, None, None, None, None))
+        self.assertEqual([r.system_code_number for r in snapshot.rows(with_readings_only=True)], ['SITE1'])
+
+    def test_snapshot_readable_by_workers(self):
+        """Test that the snapshot is world readable, for workers running as another user"""
+        write_snapshot(self.path, self.rows, 1)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+    def test_duplicate_sites(self):
+        """Test that a site with readings tied on the latest timestamp is stored once"""
+        tied = make_row('SITE1', 54.97, -1.61, co=2.5, last_updated=self.rows[0].last_updated)
+        write_snapshot(self.path, [self.rows[0], tied, self.rows[1]], 1)
+        snapshot = SnapshotReader(self.path).get()
+
+        self.assertEqual(snapshot.system_codes, ['SITE1', 'SITE2'])
+        self.assertEqual(snapshot.row(snapshot.index['SITE1']).co, 1.5)
+
+    def test_empty_snapshot(self):
+        """Test that a snapshot with no sites can be written and mapped"""
+        write_snapshot(self.path, [], 1)
+        snapshot = SnapshotReader(self.path).get()
+        self.assertEqual(len(snapshot), 0)
+        self.assertEqual(list(snapshot.rows()), [])
+
+    def test_missing_snapshot(self):
+        """Test that the reader returns None until a snapshot is written"""
+        self.assertIsNone(SnapshotReader(self.path).get())
+        self.assertEqual(read_generation(self.path), 0)
+
+    def test_unreadable_snapshot(self):
+        """Test that an empty, truncated or foreign file is ignored rather than raising"""
+        reader = SnapshotReader(self.path, check_interval=0)
+        write_snapshot(self.path, self.rows, 1)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        for content in (b'', data[:10], b'not a snapshot' * 10, data[:HEADER.size + 8]):
+            with open(self.path, 'wb') as f:
+                f.write(content)
+            self.assertIsNone(reader.get())
+
+        write_snapshot(self.path, self.rows, 2)
+        self.assertEqual(reader.get().generation, 2)
+
+    def test_reader_picks_up_swapped_snapshot(self):
+        """Test that a reader maps the new version after the file is replaced"""
+        write_snapshot(self.path, self.rows, 1)
+        reader = SnapshotReader(self.path, check_interval=0)
+        first = reader.get()
+
+        write_snapshot(self.path, self.rows[:1], 2)
+        second = reader.get()
+
+        self.assertEqual(read_generation(self.path), 2)
+        self.assertEqual(second.generation, 2)
+        self.assertEqual(len(second), 1)
+        # The old mapping stays valid for requests still using it
+        self.assertEqual(len(first), 2)
+
+    def test_stale_snapshot_ignored(self):
+        """Test that a snapshot older than max_age is ignored until a new version is written"""
+        write_snapshot(self.path, self.rows, 1)
+        os.utime(self.path, (time.time() - 600, time.time() - 600))
+        reader = SnapshotReader(self.path, check_interval=0, max_age=120)
+        self.assertIsNone(reader.get())
+
+        write_snapshot(self.path, self.rows, 2)
+        self.assertEqual(reader.get().generation, 2)
+
+    def test_endpoints_served_from_snapshot(self):
+        """Test that the heatmap and sites endpoints read from the snapshot without the database"""
+        write_snapshot(self.path, self.rows, 1)
+        app = Flask(__name__)
+        app.extensions['readings_snapshot'] = SnapshotReader(self.path)
+        app.register_blueprint(heatmap_bp)
+        app.register_blueprint(sites_bp)
+        client = app.test_client()
+
+        readings = client.get('/heatmap/latest_readings').get_json()
+        self.assertEqual(len(readings), 1)
+        self.assertEqual(readings[0]['systemCodeNumber'], 'SITE1')
+        self.assertEqual(readings[0]['readings']['lastUpdated'], '2025-07-01T12:30:15.250000')
+
+        sites = client.get('/sites').get_json()
+        self.assertEqual(len(sites['features']), 2)
+        self.assertEqual(sites['features'][1]['geometry']['coordinates'], [-1.62, 54.98])
+
+
+if __name__ == "__main__":
+    unittest.main()
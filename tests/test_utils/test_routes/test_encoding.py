@@ -0,0 +1,63 @@
+"""
+Module to test compact route encoding.
+Author: Ross Cochrane
+"""
+
+import unittest
+import base64
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from utils.routes.encoding import (
+    encode_polyline,
+    quantise_scores,
+    compact_route,
+    MISSING_SCORE,
+    COMPACT_FORMAT
+)
+
+
+class TestRouteEncoding(unittest.TestCase):
+    """Unit tests for polyline encoding and score quantisation"""
+
+    def test_encode_polyline(self):
+        """Test polyline encoding against the reference example, given as lon, lat"""
+        coordinates = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+        self.assertEqual(encode_polyline(coordinates), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_encode_polyline_empty(self):
+        """Test an empty geometry encodes to an empty string"""
+        self.assertEqual(encode_polyline([]), "")
+
+    def test_quantise_scores(self):
+        """Test scores are clamped, scaled to 0-254 and None maps to the missing marker"""
+        self.assertEqual(
+            quantise_scores([0.0, 5.0, 10.0, None, -1.0, 12.0]),
+            bytes([0, 127, 254, MISSING_SCORE, 0, 254])
+        )
+
+    def test_compact_route_json(self):
+        """Test the compact route for JSON output base64 encodes quantised scores"""
+        route = {
+            "features": [{
+                "geometry": {"coordinates": [[-120.2, 38.5], [-120.95, 40.7]]},
+                "properties": {
+                    "pollution_scores": [10.0, None],
+                    "average_pollution_score": 10.0,
+                    "summary": {"distance": 100.0, "duration": 60.0}
+                }
+            }]
+        }
+
+        compact = compact_route(route, binary=False)
+
+        self.assertEqual(compact["format"], COMPACT_FORMAT)
+        self.assertEqual(compact["polyline"], "_p~iF~ps|U_ulLnnqC")
+        self.assertEqual(base64.b64decode(compact["pollution_scores"]), bytes([254, MISSING_SCORE]))
+        self.assertEqual(compact["summary"], {"distance": 100.0, "duration": 60.0})
+        self.assertNotIn("pollutant_scores", compact)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,11 +7,20 @@ from flask import Flask
 import unittest
 from unittest.mock import patch, MagicMock
 import math
+import tempfile
+import shutil
 import sys
 import os
+from datetime import datetime
+from types import SimpleNamespace
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 
-from utils.routes.enrichment import enrich_route_with_pollution
+from utils.routes.enrichment import (
+    enrich_route_with_pollution,
+    latest_reading_row,
+    latest_snapshot_row
+)
+from utils.pollution.snapshot import write_snapshot, SnapshotReader
 
 class TestEnrichRouteWithPollution(unittest.TestCase):
     """Unit tests for enrich_route_with_pollution function"""
@@ -37,13 +46,13 @@ class TestEnrichRouteWithPollution(unittest.TestCase):
         }
 
     @patch("utils.routes.enrichment.compute_aqi")
-    @patch("utils.routes.enrichment.PollutionReading.query")
-    def test_enrichment_with_valid_readings(self, mock_query, mock_compute_aqi):
+    @patch("utils.routes.enrichment.latest_reading_row")
+    def test_enrichment_with_valid_readings(self, mock_latest, mock_compute_aqi):
         """Test enrichment when pollution readings are found for all coordinates"""
 
         # Mock reading object and AQI computation
         mock_reading = MagicMock()
-        mock_query.join.return_value.filter.return_value.order_by.return_value.first.side_effect = [
+        mock_latest.side_effect = [
             mock_reading, mock_reading, mock_reading
         ]
         mock_compute_aqi.return_value = 5.0
@@ -57,11 +66,11 @@ class TestEnrichRouteWithPollution(unittest.TestCase):
         self.assertEqual(avg, 5.0)
 
     @patch("utils.routes.enrichment.compute_aqi")
-    @patch("utils.routes.enrichment.PollutionReading.query")
-    def test_enrichment_with_missing_readings(self, mock_query, mock_compute_aqi):
+    @patch("utils.routes.enrichment.latest_reading_row")
+    def test_enrichment_with_missing_readings(self, mock_latest, mock_compute_aqi):
         """Test enrichment when no pollution readings are found"""
 
-        mock_query.join.return_value.filter.return_value.order_by.return_value.first.return_value = None
+        mock_latest.return_value = None
 
         enriched = enrich_route_with_pollution(self.route_geojson.copy(), "co")
 
@@ -72,12 +81,12 @@ class TestEnrichRouteWithPollution(unittest.TestCase):
         self.assertIsNone(avg)
 
     @patch("utils.routes.enrichment.compute_aqi")
-    @patch("utils.routes.enrichment.PollutionReading.query")
-    def test_enrichment_with_invalid_scores(self, mock_query, mock_compute_aqi):
+    @patch("utils.routes.enrichment.latest_reading_row")
+    def test_enrichment_with_invalid_scores(self, mock_latest, mock_compute_aqi):
         """Test enrichment when AQI returns None or inf"""
 
         mock_reading = MagicMock()
-        mock_query.join.return_value.filter.return_value.order_by.return_value.first.side_effect = [
+        mock_latest.side_effect = [
             mock_reading, mock_reading, mock_reading
         ]
         mock_compute_aqi.side_effect = [None, float("inf"), 7.0]
@@ -90,5 +99,78 @@ class TestEnrichRouteWithPollution(unittest.TestCase):
         self.assertEqual(scores, [None, None, 7.0])
         self.assertEqual(avg, 7.0)
 
+    @patch("utils.routes.enrichment.latest_reading_row")
+    def test_enrichment_with_multiple_pollutants(self, mock_latest):
+        """Test that several pollutants are scored from a single lookup per coordinate"""
+
+        mock_reading = MagicMock(co=2.55, no=75, no2=150, noise=65)
+        mock_latest.side_effect = [mock_reading, None, mock_reading]
+
+        enriched = enrich_route_with_pollution(self.route_geojson.copy(), "co", ["co", "noise"])
+        properties = enriched["features"][0]["properties"]
+
+        self.assertEqual(mock_latest.call_count, 3)
+        self.assertEqual(properties["pollution_scores"], [5.0, None, 5.0])
+        self.assertEqual(properties["pollutant_scores"]["noise"], [5.0, None, 5.0])
+        self.assertEqual(properties["average_pollutant_scores"], {"co": 5.0, "noise": 5.0})
+
+    @patch("utils.routes.enrichment.db")
+    def test_latest_reading_row_selects_columns(self, mock_db):
+        """Test that the reading lookup selects plain columns rather than ORM instances"""
+        row = SimpleNamespace(co=1.0, no=2.0, no2=3.0, noise=4.0)
+        mock_db.session.execute.return_value.first.return_value = row
+
+        self.assertIs(latest_reading_row(8.68, 49.41), row)
+
+        statement = mock_db.session.execute.call_args[0][0]
+        self.assertEqual(
+            [c.name for c in statement.selected_columns], ["co", "no", "no2", "noise"]
+        )
+
+    @patch("utils.routes.enrichment.db")
+    def test_latest_snapshot_row(self, mock_db):
+        """Test that the snapshot lookup picks the most recent reading among nearby sites"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "readings.snapshot")
+
+        def row(code, co, last_updated):
+            return SimpleNamespace(
+                system_code_number=code, latitude=49.41, longitude=8.68,
+                co=co, no=None, no2=None, noise=None, last_updated=last_updated
+            )
+
+        write_snapshot(path, [
+            row("OLD", 1.0, datetime(2025, 7, 1, 9, 0)),
+            row("NEW", 2.0, datetime(2025, 7, 1, 10, 0)),
+            row("EMPTY", None, None)
+        ], 1)
+        snapshot = SnapshotReader(path).get()
+
+        mock_db.session.execute.return_value.scalars.return_value.all.return_value = [
+            "OLD", "EMPTY", "NEW", "UNKNOWN"
+        ]
+        self.assertEqual(latest_snapshot_row(snapshot, 8.68, 49.41).co, 2.0)
+
+        mock_db.session.execute.return_value.scalars.return_value.all.return_value = ["EMPTY"]
+        self.assertIsNone(latest_snapshot_row(snapshot, 8.68, 49.41))
+
+    @patch("utils.routes.enrichment.latest_reading_row")
+    @patch("utils.pollution.site_index.query_latest_readings")
+    def test_enrichment_with_knn_scoring(self, mock_query, mock_latest):
+        """Test that knn scoring interpolates from nearby sites without per-vertex queries"""
+        mock_query.return_value = [
+            SimpleNamespace(system_code_number="A", longitude=8.682, latitude=49.415,
+                            co=2.55, no=None, no2=None, noise=None)
+        ]
+        self.app.config["KNN_MAX_RADIUS_M"] = 100
+
+        enriched = enrich_route_with_pollution(self.route_geojson.copy(), "co", scoring="knn")
+        scores = enriched["features"][0]["properties"]["pollution_scores"]
+
+        mock_latest.assert_not_called()
+        # The vertices are ~57m, 0m and ~133m from the site
+        self.assertEqual(scores, [5.0, 5.0, None])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Provides single-flight request coalescing.
+Concurrent calls with the same key share one in-flight computation and all receive its result.
+Author: Ross Cochrane
+"""
+
+import threading
+from flask import current_app
+
+
+class _Call:
+    """An in-flight computation and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time.
+    Counts requests and executions per namespace so the coalescing ratio can be reported.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._requests = {}
+        self._executions = {}
+
+    def do(self, namespace, key, fn):
+        """
+        Return fn(), sharing the result with any concurrent call for the same namespace and key.
+        If fn raises, every caller waiting on it receives the same exception.
+        :param namespace: Name the call is counted under, e.g. the endpoint
+        :param key: Hashable, normalised request parameters
+        :param fn: Zero argument callable performing the computation
+        """
+        with self._lock:
+            self._requests[namespace] = self._requests.get(namespace, 0) + 1
+            call = self._calls.get((namespace, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(namespace, key)] = _Call()
+                self._executions[namespace] = self._executions.get(namespace, 0) + 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[(namespace, key)]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """
+        Returns requests, executions, coalesced requests and the coalescing ratio
+        (share of requests served by another request's computation) per namespace.
+        """
+        with self._lock:
+            stats = {}
+            for namespace, requests in self._requests.items():
+                executions = self._executions.get(namespace, 0)
+                stats[namespace] = {
+                    'requests': requests,
+                    'executions': executions,
+                    'coalesced': requests - executions,
+                    'coalescing_ratio': round((requests - executions) / requests, 4)
+                }
+            return stats
+
+
+def get_coalescer():
+    """Return the SingleFlight shared by all requests to the current app."""
+    coalescer = current_app.extensions.get('coalescer')
+    if coalescer is None:
+        coalescer = current_app.extensions.setdefault('coalescer', SingleFlight())
+    return coalescer
@@ -4,6 +4,9 @@ Pollutants are normalised 0-10.0 based on simulated ranges.
 Author: Ross Cochrane
 """
 
+# Pollutants that can be scored, in the order returned when 'all' is requested
+POLLUTANTS = ('co', 'no', 'no2', 'noise', 'aqi')
+
 def normalise_co(co):
     """
     Normalise CO level (in ppm) to a scale of 0–10.0.
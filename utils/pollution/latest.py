@@ -0,0 +1,53 @@
+"""
+Provides the query for the latest pollution reading at each site.
+Shared by the heatmap endpoint and the readings snapshot.
+Author: Ross Cochrane
+"""
+
+from sqlalchemy.orm import aliased
+from sqlalchemy import func, and_
+from extensions import db
+from models.site import Site
+from models.pollution_reading import PollutionReading
+
+
+def query_latest_readings(include_empty_sites=False):
+    """
+    Returns one row per site with its location and latest pollution reading.
+    :param include_empty_sites: Also return sites with no readings (reading columns are None)
+    :return: List of rows with system_code_number, latitude, longitude, co, no, no2, noise, last_updated
+    """
+
+    # Subquery to get the latest timestamp for each system_code_number
+
+    subquery = db.session.query(
+        PollutionReading.system_code_number,
+        func.max(PollutionReading.last_updated).label('latest')
+    ).group_by(PollutionReading.system_code_number).subquery()
+
+    ReadingAlias = aliased(PollutionReading)
+
+    # Main query to fetch site info and corresponding latest pollution readings
+
+    query = db.session.query(
+        Site.system_code_number,
+        Site.latitude,
+        Site.longitude,
+        ReadingAlias.co,
+        ReadingAlias.no,
+        ReadingAlias.no2,
+        ReadingAlias.noise,
+        ReadingAlias.last_updated
+    )
+    site_latest = Site.system_code_number == subquery.c.system_code_number
+    latest_reading = and_(
+        Site.system_code_number == ReadingAlias.system_code_number,
+        ReadingAlias.last_updated == subquery.c.latest
+    )
+
+    if include_empty_sites:
+        query = query.outerjoin(subquery, site_latest).outerjoin(ReadingAlias, latest_reading)
+    else:
+        query = query.join(subquery, site_latest).join(ReadingAlias, latest_reading)
+
+    return query.all()
@@ -0,0 +1,155 @@
+"""
+Provides an in-memory spatial index of sites with a latest reading, for k-nearest-site scoring.
+Sites are bucketed into a uniform grid. A lookup scans rings of cells outwards until the k nearest
+sites are certain or the maximum radius is reached. Scores are interpolated by inverse distance weighting.
+Author: Ross Cochrane
+"""
+
+import math
+import time
+from array import array
+from flask import current_app
+from utils.pollution.aqi import compute_aqi
+from utils.pollution.latest import query_latest_readings
+from utils.pollution.snapshot import current_snapshot
+
+# Defaults, overridable through app config (KNN_NEIGHBOURS, KNN_MAX_RADIUS_M, KNN_POWER, SITE_INDEX_TTL)
+DEFAULT_NEIGHBOURS = 3
+DEFAULT_MAX_RADIUS_M = 500.0
+DEFAULT_POWER = 2.0
+DEFAULT_TTL = 30.0
+
+METRES_PER_DEGREE = 111320.0
+
+# Sites closer than this are treated as being at the vertex, avoiding infinite weights
+MIN_DISTANCE_M = 1.0
+
+
+class SiteIndex:
+    """
+    Grid index over site coordinates with the site's latest reading.
+    :param rows: Rows with system_code_number, latitude, longitude and reading columns,
+                 e.g. from query_latest_readings or ReadingsSnapshot.rows
+    :param cell_size: Grid cell size in metres
+    """
+
+    def __init__(self, rows, cell_size=DEFAULT_MAX_RADIUS_M):
+        self.cell_size = cell_size
+        self.longitudes = array('d')
+        self.latitudes = array('d')
+        self.readings = []
+        self.cells = {}
+        self._scores = {}
+
+        for row in rows:
+            if row.latitude is None or row.longitude is None:
+                continue
+            self.longitudes.append(row.longitude)
+            self.latitudes.append(row.latitude)
+            self.readings.append(row)
+
+        # Cell size in degrees, longitude scaled for the sites' mean latitude
+        mean_lat = sum(self.latitudes) / len(self.latitudes) if self.readings else 0.0
+        self._cell_lat = cell_size / METRES_PER_DEGREE
+        self._cell_lon = cell_size / (METRES_PER_DEGREE * max(math.cos(math.radians(mean_lat)), 0.01))
+
+        for i in range(len(self.readings)):
+            self.cells.setdefault(self._cell(self.longitudes[i], self.latitudes[i]), []).append(i)
+
+    def __len__(self):
+        return len(self.readings)
+
+    def _cell(self, lon, lat):
+        return (math.floor(lon / self._cell_lon), math.floor(lat / self._cell_lat))
+
+    def _cell_extent(self, lat):
+        """
+        Smallest side of a grid cell in metres, measured as distance() does at latitude lat.
+        Cells are sized for the sites' mean latitude, so away from it a cell is narrower
+        (or wider) than cell_size along longitude.
+        """
+        width = self._cell_lon * METRES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        return min(self.cell_size, width)
+
+    def distance(self, lon, lat, i):
+        """Approximate (equirectangular) distance in metres from a point to site i."""
+        dx = (self.longitudes[i] - lon) * math.cos(math.radians(lat))
+        dy = self.latitudes[i] - lat
+        return math.hypot(dx, dy) * METRES_PER_DEGREE
+
+    def nearest(self, lon, lat, k=DEFAULT_NEIGHBOURS, max_radius=DEFAULT_MAX_RADIUS_M):
+        """
+        Returns up to k (distance, site) pairs nearest to a point within max_radius metres, closest first.
+        """
+        cx, cy = self._cell(lon, lat)
+        extent = self._cell_extent(lat)
+        max_ring = math.ceil(max_radius / extent)
+        found = []
+
+        for ring in range(max_ring + 1):
+            for dx in range(-ring, ring + 1):
+                for dy in range(-ring, ring + 1):
+                    if max(abs(dx), abs(dy)) != ring:
+                        continue  # Inner cells were scanned by earlier rings
+                    for i in self.cells.get((cx + dx, cy + dy), ()):
+                        d = self.distance(lon, lat, i)
+                        if d <= max_radius:
+                            found.append((d, i))
+
+            # Unscanned sites are at least `ring` whole cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= ring * extent:
+                    break
+
+        found.sort()
+        return found[:k]
+
+    def site_score(self, i, pollutant):
+        """Score of site i's latest reading for a pollutant, computed once per site."""
+        key = (i, pollutant)
+        if key not in self._scores:
+            score = compute_aqi(self.readings[i], pollutant)
+            self._scores[key] = None if score is None or math.isinf(score) else score
+        return self._scores[key]
+
+    def interpolate(self, neighbours, pollutant, power=DEFAULT_POWER):
+        """
+        Inverse distance weighted score from (distance, site) pairs returned by nearest().
+        Rounded to 2 decimal places like the normalised scores used by radius scoring.
+        Returns None if no neighbour has a score.
+        """
+        total = weights = 0.0
+        for d, i in neighbours:
+            score = self.site_score(i, pollutant)
+            if score is None:
+                continue
+            weight = 1.0 / max(d, MIN_DISTANCE_M) ** power
+            total += weight * score
+            weights += weight
+        return round(total / weights, 2) if weights else None
+
+
+def current_site_index():
+    """
+    Returns the site index for the current app.
+    It is rebuilt when the shared snapshot changes. Without a snapshot it is rebuilt from
+    the database once it is older than SITE_INDEX_TTL seconds.
+    """
+    config = current_app.config
+    snapshot = current_snapshot()
+    source = snapshot.generation if snapshot is not None else None
+    now = time.monotonic()
+
+    cached = current_app.extensions.get('site_index')
+    if cached is not None:
+        index, cached_source, built = cached
+        if snapshot is not None and cached_source == source:
+            return index
+        if snapshot is None and cached_source is None and now - built < config.get('SITE_INDEX_TTL', DEFAULT_TTL):
+            return index
+
+    rows = snapshot.rows(with_readings_only=True) if snapshot is not None else query_latest_readings()
+    index = SiteIndex(rows, config.get('KNN_MAX_RADIUS_M', DEFAULT_MAX_RADIUS_M))
+    current_app.extensions['site_index'] = (index, source, now)
+    return index
@@ -0,0 +1,297 @@
+"""
+Provides a compact, memory-mapped snapshot of site locations and latest pollution readings.
+The snapshot file is written by a single refresher process and mapped read-only by every
+worker, so all workers share one copy through the page cache instead of each holding their own.
+New versions are written to a temporary file and swapped in with an atomic rename.
+Author: Ross Cochrane
+"""
+
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+
+MAGIC = b'PANTSNP1'
+
+# magic, generation, site count, length of the system code block
+HEADER = struct.Struct('=8sQQQ')
+
+# Float64 columns stored one after another after the header, NaN marks a missing value
+COLUMNS = ('latitude', 'longitude', 'co', 'no', 'no2', 'noise', 'last_updated')
+
+EPOCH = datetime(1970, 1, 1)
+
+# Row with the same attributes as the latest readings query and the Site model
+SnapshotRow = namedtuple('SnapshotRow', ('system_code_number',) + COLUMNS)
+
+# A snapshot is stale once this many refresh intervals have passed without a new version
+STALE_AFTER_REFRESHES = 4
+
+# create_app config for processes that only need the database
+DB_ONLY_CONFIG = {
+    'ENABLE_ROUTING': False, 'ENABLE_SITES': False, 'ENABLE_HEATMAP': False, 'ENABLE_METRICS': False
+}
+
+
+def to_float(value):
+    """Convert a nullable value to float, None becomes NaN."""
+    return math.nan if value is None else float(value)
+
+
+def from_float(value):
+    """Convert a stored float back to a nullable value, NaN becomes None."""
+    return None if math.isnan(value) else value
+
+
+def to_epoch(value):
+    """Convert a naive UTC datetime to epoch seconds, None becomes NaN."""
+    return math.nan if value is None else (value - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    """Convert epoch seconds back to a naive datetime, NaN becomes None."""
+    return None if math.isnan(seconds) else EPOCH + timedelta(seconds=seconds)
+
+
+def write_snapshot(path, rows, generation):
+    """
+    Write rows to a new snapshot file and atomically replace the file at path.
+    :param path: Snapshot file path
+    :param rows: Rows from query_latest_readings, at most one is kept per site
+    :param generation: Version number stored in the header
+    """
+    codes = []
+    columns = {name: array('d') for name in COLUMNS}
+
+    seen = set()
+
+    for row in rows:
+        # Readings tied on the latest timestamp give a site several rows, keep the first
+        if row.system_code_number in seen:
+            continue
+        seen.add(row.system_code_number)
+        codes.append(row.system_code_number)
+        columns['latitude'].append(to_float(row.latitude))
+        columns['longitude'].append(to_float(row.longitude))
+        columns['co'].append(to_float(row.co))
+        columns['no'].append(to_float(row.no))
+        columns['no2'].append(to_float(row.no2))
+        columns['noise'].append(to_float(row.noise))
+        columns['last_updated'].append(to_epoch(row.last_updated))
+
+    codes_blob = '\n'.join(codes).encode('utf-8')
+
+    # Write beside the target so the rename stays on one filesystem and is atomic
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        # mkstemp creates the file 0600; workers may run as a different user from the writer
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, generation, len(codes), len(codes_blob)))
+            for name in COLUMNS:
+                columns[name].tofile(f)
+            f.write(codes_blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class ReadingsSnapshot:
+    """
+    Read-only view over a snapshot buffer.
+    Each column is a float64 memoryview straight into the mapping, no data is copied.
+    """
+
+    def __init__(self, buffer):
+        magic, self.generation, count, codes_length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a readings snapshot')
+        if len(buffer) < HEADER.size + count * 8 * len(COLUMNS) + codes_length:
+            raise ValueError('Truncated readings snapshot')
+
+        view = memoryview(buffer)
+        offset = HEADER.size
+        for name in COLUMNS:
+            setattr(self, name, view[offset:offset + count * 8].cast('d'))
+            offset += count * 8
+
+        codes = bytes(view[offset:offset + codes_length]).decode('utf-8')
+        self.system_codes = codes.split('\n') if count else []
+        self.index = {code: i for i, code in enumerate(self.system_codes)}
+
+    def __len__(self):
+        return len(self.system_codes)
+
+    def row(self, i):
+        """Return the site and reading at position i as a SnapshotRow."""
+        return SnapshotRow(
+            self.system_codes[i],
+            from_float(self.latitude[i]),
+            from_float(self.longitude[i]),
+            from_float(self.co[i]),
+            from_float(self.no[i]),
+            from_float(self.no2[i]),
+            from_float(self.noise[i]),
+            from_epoch(self.last_updated[i])
+        )
+
+    def rows(self, with_readings_only=False):
+        """
+        Yield every site as a SnapshotRow.
+        :param with_readings_only: Skip sites that have no reading
+        """
+        for i in range(len(self)):
+            if with_readings_only and math.isnan(self.last_updated[i]):
+                continue
+            yield self.row(i)
+
+
+def open_snapshot(f):
+    """Map an open snapshot file read-only and return a ReadingsSnapshot over it."""
+    return ReadingsSnapshot(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def read_generation(path):
+    """Return the generation of the snapshot at path, or 0 if there is no valid snapshot."""
+    try:
+        with open(path, 'rb') as f:
+            magic, generation, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return generation if magic == MAGIC else 0
+
+
+class SnapshotReader:
+    """
+    Gives a worker the current snapshot.
+    The file is checked at most once per check_interval and re-mapped when the
+    refresher has swapped in a new version. Old mappings are released once unreferenced.
+    A snapshot last written more than max_age seconds ago is ignored, so workers fall back
+    to the database if the refresher has died.
+    """
+
+    def __init__(self, path, check_interval=1.0, max_age=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._snapshot = None
+        self._current = None
+        self._file_id = None
+        self._checked = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return the current ReadingsSnapshot, or None if none has been written yet,
+        it cannot be read or it is stale.
+        """
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return self._current
+
+        with self._lock:
+            self._checked = now
+            try:
+                with open(self.path, 'rb') as f:
+                    stat = os.fstat(f.fileno())
+                    file_id = (stat.st_ino, stat.st_mtime_ns)
+                    if file_id != self._file_id:
+                        self._snapshot = open_snapshot(f)
+                        self._file_id = file_id
+            except FileNotFoundError:
+                self._current = None
+                return None
+            except (OSError, ValueError, struct.error) as e:
+                # Unreadable, empty, truncated or not a snapshot: serve from the database instead
+                if self._error != str(e):
+                    print(f"Error: cannot read snapshot {self.path}, using the database: {e}")
+                    self._error = str(e)
+                self._current = None
+                return None
+            self._error = None
+
+            stale = self.max_age is not None and time.time() - stat.st_mtime > self.max_age
+            if stale and self._current is not None:
+                print(f"Error: snapshot {self.path} is older than {self.max_age:g}s, using the database")
+            self._current = None if stale else self._snapshot
+            return self._current
+
+
+def current_snapshot():
+    """Return the snapshot for the current app, or None if no snapshot is configured or written yet."""
+    reader = current_app.extensions.get('readings_snapshot')
+    return reader.get() if reader is not None else None
+
+
+def refresh_snapshot(path):
+    """
+    Query the latest readings and swap in a new snapshot. Must run inside an app context.
+    :return: The new generation number
+    """
+    from utils.pollution.latest import query_latest_readings
+
+    generation = read_generation(path) + 1
+    write_snapshot(path, query_latest_readings(include_empty_sites=True), generation)
+    return generation
+
+
+def warm_snapshot(path):
+    """
+    Write the first snapshot before workers are forked.
+    The engine is disposed afterwards so no database connections are inherited by workers.
+    """
+    from app import create_app
+    from extensions import db
+
+    app = create_app(DB_ONLY_CONFIG)
+    with app.app_context():
+        try:
+            refresh_snapshot(path)
+        finally:
+            db.session.remove()
+            db.engine.dispose()
+
+
+def run_refresher(path, interval):
+    """Refresh loop run by the single refresher process."""
+    from app import create_app
+    from extensions import db
+
+    app = create_app(DB_ONLY_CONFIG)
+    with app.app_context():
+        while True:
+            time.sleep(interval)
+            try:
+                refresh_snapshot(path)
+            except Exception as e:
+                print(f"Error: snapshot refresh failed: {e}")
+            finally:
+                # End the transaction so the next refresh sees new readings
+                db.session.remove()
+
+
+def start_refresher(path, interval):
+    """
+    Start the refresher in a separate process.
+    A spawned (not forked) process is used so it shares no state with the parent.
+    """
+    import multiprocessing
+
+    process = multiprocessing.get_context('spawn').Process(
+        target=run_refresher, args=(path, interval), name='snapshot-refresher', daemon=True
+    )
+    process.start()
+    return process
@@ -0,0 +1,113 @@
+"""
+Provides a compact encoding of an enriched route for bandwidth constrained clients.
+Geometry is polyline encoded and pollution scores are quantised to one byte per vertex.
+Author: Ross Cochrane
+"""
+
+import base64
+
+try:
+    import msgpack
+except ImportError:  # MessagePack output is optional
+    msgpack = None
+
+
+COMPACT_FORMAT = 'pant-compact-v1'
+
+# Decimal places kept by the polyline, also reported to clients in the compact body
+POLYLINE_PRECISION = 5
+
+# Scores are normalised 0-10.0, quantised to 0-254 with 255 marking a missing score
+SCORE_MAX = 10.0
+SCORE_STEPS = 254
+MISSING_SCORE = 255
+
+
+def encode_polyline(coordinates, precision=POLYLINE_PRECISION):
+    """
+    Encode [lon, lat] coordinates with the Google encoded polyline algorithm.
+    Points are written in lat, lon order as expected by polyline decoders.
+    :param coordinates: Iterable of [lon, lat] pairs
+    :param precision: Number of decimal places kept
+    :return: Encoded polyline string
+    """
+    factor = 10 ** precision
+    encoded = bytearray()
+    prev_lat = prev_lon = 0
+
+    for lon, lat in coordinates:
+        lat_i = int(round(lat * factor))
+        lon_i = int(round(lon * factor))
+
+        for delta in (lat_i - prev_lat, lon_i - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                encoded.append((0x20 | (value & 0x1f)) + 63)
+                value >>= 5
+            encoded.append(value + 63)
+
+        prev_lat, prev_lon = lat_i, lon_i
+
+    return encoded.decode('ascii')
+
+
+def quantise_scores(scores):
+    """
+    Quantise 0-10.0 pollution scores to one unsigned byte each.
+    Scores are clamped to range and None becomes MISSING_SCORE.
+    :param scores: Iterable of scores or None
+    :return: bytes with one value per score
+    """
+    scale = SCORE_STEPS / SCORE_MAX
+    return bytes(
+        MISSING_SCORE if s is None else int(round(max(0.0, min(s, SCORE_MAX)) * scale))
+        for s in scores
+    )
+
+
+def compact_route(route_geojson, binary=True):
+    """
+    Build the compact representation of an enriched route.
+    :param route_geojson: Enriched GeoJSON route
+    :param binary: Keep quantised scores as raw bytes (MessagePack), otherwise base64 encode them (JSON)
+    :return: dict ready for serialisation
+    """
+    feature = route_geojson['features'][0]
+    properties = feature['properties']
+
+    def pack(scores):
+        data = quantise_scores(scores)
+        return data if binary else base64.b64encode(data).decode('ascii')
+
+    compact = {
+        'format': COMPACT_FORMAT,
+        'polyline': encode_polyline(feature['geometry']['coordinates'], POLYLINE_PRECISION),
+        'precision': POLYLINE_PRECISION,
+        'score_scale': SCORE_MAX / SCORE_STEPS,
+        'missing_score': MISSING_SCORE,
+        'pollution_scores': pack(properties.get('pollution_scores', [])),
+        'average_pollution_score': properties.get('average_pollution_score'),
+    }
+
+    summary = properties.get('summary')
+    if summary is not None:
+        compact['summary'] = summary
+
+    if 'pollutant_scores' in properties:
+        compact['primary_pollutant'] = properties.get('primary_pollutant')
+        compact['pollutant_scores'] = {
+            p: pack(scores) for p, scores in properties['pollutant_scores'].items()
+        }
+        compact['average_pollutant_scores'] = properties.get('average_pollutant_scores')
+
+    return compact
+
+
+def pack_msgpack(data):
+    """
+    Serialise data with MessagePack.
+    Raises RuntimeError if the optional msgpack package is not installed.
+    """
+    if msgpack is None:
+        raise RuntimeError('msgpack is not installed')
+    return msgpack.packb(data, use_bin_type=True)
@@ -3,51 +3,161 @@ Provides functionality to enrich a route GeoJSON with pollution data.
 Author: Ross Cochrane
 """
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select
 from geoalchemy2.functions import ST_Point, ST_DWithin, ST_SetSRID
+from extensions import db
 from models.pollution_reading import PollutionReading
 from models.site import Site
 from utils.pollution.aqi import compute_aqi
+from utils.pollution.snapshot import current_snapshot
+from utils.pollution import site_index
+from flask import current_app
 import math
 
+# Scoring modes: latest reading within SEARCH_RADIUS (SQL), or k-nearest sites from the in-memory index
+SCORING_MODES = ('radius', 'knn')
 
-def enrich_route_with_pollution(route_geojson, pollutant):
+# Search radius in degrees (~200m)
+SEARCH_RADIUS = 0.002
+
+
+def within_radius(lon, lat):
+    """SQL condition matching sites within SEARCH_RADIUS of a point."""
+    return ST_DWithin(Site.location, ST_SetSRID(ST_Point(lon, lat), 4326), SEARCH_RADIUS)
+
+
+def latest_reading_row(lon, lat):
+    """
+    Returns the most recent reading from any site within the search radius.
+    Only the scored columns are selected, as a plain row rather than an ORM instance,
+    so no identity map, relationship or per-object state is built.
+    """
+    return db.session.execute(
+        select(
+            PollutionReading.co,
+            PollutionReading.no,
+            PollutionReading.no2,
+            PollutionReading.noise
+        ).join(Site).where(
+            within_radius(lon, lat)
+        ).order_by(PollutionReading.last_updated.desc()).limit(1)
+    ).first()
+
+
+def latest_snapshot_row(snapshot, lon, lat):
+    """
+    Returns the most recent reading from any site within the search radius, using the
+    shared snapshot's columns for the readings so only site codes come back from the database.
+    """
+    codes = db.session.execute(
+        select(Site.system_code_number).where(within_radius(lon, lat))
+    ).scalars().all()
+
+    last_updated = snapshot.last_updated
+    best = None
+    for code in codes:
+        i = snapshot.index.get(code)
+        if i is None or math.isnan(last_updated[i]):
+            continue  # Site has no reading
+        if best is None or last_updated[i] > last_updated[best]:
+            best = i
+
+    return snapshot.row(best) if best is not None else None
+
+
+def average_score(scores):
+    """Average the non-None scores in a list, or None if there are none."""
+    valid_scores = [s for s in scores if s is not None]
+    return sum(valid_scores) / len(valid_scores) if valid_scores else None
+
+
+def radius_scores(coordinates, scored_pollutants):
+    """
+    Scores every coordinate from the most recent reading within SEARCH_RADIUS.
+    :return: dict mapping each pollutant to its list of scores
+    """
+    scores_by_pollutant = {p: [] for p in scored_pollutants}
+
+    snapshot = current_snapshot()
+
+    for lon, lat in coordinates:
+        if snapshot is not None:
+            reading = latest_snapshot_row(snapshot, lon, lat)
+        else:
+            reading = latest_reading_row(lon, lat)
+
+        for p in scored_pollutants:
+            if reading:
+                score = compute_aqi(reading, p)
+                score = None if score is None or math.isinf(score) else score
+            else:
+                score = None
+
+            scores_by_pollutant[p].append(score)
+
+    return scores_by_pollutant
+
+
+def knn_scores(coordinates, scored_pollutants):
+    """
+    Scores every coordinate by distance-weighted interpolation between the k nearest sites
+    within KNN_MAX_RADIUS_M, using the in-memory site index rather than the database.
+    :return: dict mapping each pollutant to its list of scores
+    """
+    config = current_app.config
+    k = config.get('KNN_NEIGHBOURS', site_index.DEFAULT_NEIGHBOURS)
+    max_radius = config.get('KNN_MAX_RADIUS_M', site_index.DEFAULT_MAX_RADIUS_M)
+    power = config.get('KNN_POWER', site_index.DEFAULT_POWER)
+
+    index = site_index.current_site_index()
+    scores_by_pollutant = {p: [] for p in scored_pollutants}
+
+    for lon, lat in coordinates:
+        neighbours = index.nearest(lon, lat, k, max_radius)
+        for p in scored_pollutants:
+            scores_by_pollutant[p].append(index.interpolate(neighbours, p, power))
+
+    return scores_by_pollutant
+
+
+def enrich_route_with_pollution(route_geojson, pollutant, pollutants=None, scoring='radius'):
     """
     For each coordinate in the route geometry:
-    - Queries the database for the nearest pollution reading within 200m
+    - Finds the most recent pollution reading within 200m
     - Computes a score using either the selected pollutant or AQI
     - Appends the score to a list
 
     The resulting list of scores is attached to the route's GeoJSON properties
     under 'pollution_scores'.
+    When a list of pollutants is given, every pollutant is scored from the same reading
+    lookup and attached under 'pollutant_scores' and 'average_pollutant_scores'.
+    With scoring='knn', each coordinate is instead scored from the k nearest sites (see knn_scores).
     :param route_geojson: GeoJSON object returned by OpenRouteService
     :param pollutant: 'co', 'no', 'no2', 'noise', or 'aqi'
+    :param pollutants: Optional list of pollutants to score alongside the primary pollutant
+    :param scoring: 'radius' or 'knn'
     :return: Enriched GeoJSON with pollution scores
     """
 
     coordinates = route_geojson['features'][0]['geometry']['coordinates']
-    pollution_scores = []
 
-    for lon, lat in coordinates:
-        reading = PollutionReading.query.join(Site).filter(
-            ST_DWithin(
-                Site.location,
-                ST_SetSRID(ST_Point(lon, lat), 4326),
-                0.002  # 200m radius
-            )
-    ).order_by(PollutionReading.last_updated.desc()).first()
-
-        if reading:
-            score = compute_aqi(reading, pollutant)
-            score = None if score is None or math.isinf(score) else score
-        else:
-            score = None
+    # Primary pollutant first, duplicates removed
+    scored_pollutants = list(dict.fromkeys([pollutant] + list(pollutants or [])))
 
-        pollution_scores.append(score)
+    if scoring == 'knn':
+        scores_by_pollutant = knn_scores(coordinates, scored_pollutants)
+    else:
+        scores_by_pollutant = radius_scores(coordinates, scored_pollutants)
 
     # Attach scores to route properties
-    valid_scores = [s for s in pollution_scores if s is not None]
-    avg_score = sum(valid_scores) / len(valid_scores) if valid_scores else None
-    route_geojson['features'][0]['properties']['pollution_scores'] = pollution_scores
-    route_geojson['features'][0]['properties']['average_pollution_score'] = avg_score
-    return route_geojson
\ No newline at end of file
+    pollution_scores = scores_by_pollutant[pollutant]
+    properties = route_geojson['features'][0]['properties']
+    properties['pollution_scores'] = pollution_scores
+    properties['average_pollution_score'] = average_score(pollution_scores)
+
+    if pollutants:
+        properties['pollutant_scores'] = scores_by_pollutant
+        properties['average_pollutant_scores'] = {
+            p: average_score(scores) for p, scores in scores_by_pollutant.items()
+        }
+    return route_geojson